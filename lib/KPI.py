@@ -2,74 +2,141 @@ import os
 import pandas as pd
 import glob
 import re
+import fnmatch
+import gzip
+import io
+import mmap
 import numpy as np
 
+# zstandard is only needed for .log.zst node logs
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 
+# Log line prefix of every technology the tool charts, keyed by its page label.
+# Adding a technology only needs a new entry here.
+KPI_TECHNOLOGIES = {
+    "5G": "GREP_KPI_5G",
+    "LTE": "GREP_KPI_LTE",
+}
 
+KPI_WINDOWS = ["BEFORE", "AFTER"]
+
+# Default number of ROPs kept per window; None or 0 keeps every ROP from the start time on
+MAX_ROP = 68
+
+# Per-node log files read from a dump folder; compressed logs are decompressed while scanning
+LOG_EXTENSIONS = [".log", ".log.gz", ".log.zst"]
+
+
+# Dataset key of the frame parsed for a technology and window, e.g. KPI_5G_BEFORE
+def frame_key(technology, window):
+    return f"KPI_{technology}_{window}"
 
     
-# Function to process KPI log files
-def process_kpi_logs(folder, pattern, start_defined):
-    all_data = []
-    datetime_headers = set()
+# Compile shell-style globs (e.g. "NR*", "pmRrc?ucc") into one match function, None when no globs are given
+def compile_globs(patterns):
+    if not patterns:
+        return None
+    regex = re.compile("|".join(fnmatch.translate(p) for p in patterns))
+    return lambda value: regex.match(value) is not None
+
+
+def get_nodename(log_file):
+    name = os.path.basename(log_file)
+    for extension in sorted(LOG_EXTENSIONS, key=len, reverse=True):
+        if name.endswith(extension):
+            return name[:-len(extension)]
+    return os.path.splitext(name)[0]
+
+
+# Open a node log as a binary stream, decompressing .gz/.zst logs on the fly without a full copy
+def open_log(log_file):
+    if log_file.endswith(".gz"):
+        return gzip.open(log_file, "rb")
+    if log_file.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError(f"Reading {os.path.basename(log_file)} requires the 'zstandard' package (pip install zstandard)")
+        reader = zstandard.ZstdDecompressor().stream_reader(open(log_file, "rb"), closefd=True)
+        return io.BufferedReader(reader)
+    return open(log_file, "rb")
+
+
+# Yield the raw bytes of every line of a node log that starts with needle.
+# Plain logs are memory-mapped and searched for b"\n" + needle, so lines without the
+# prefix are never split or decoded; compressed logs are streamed line by line.
+def iter_prefixed_lines(log_file, needle):
+    if log_file.endswith((".gz", ".zst")):
+        with open_log(log_file) as file:
+            for line in file:
+                if line.startswith(needle):
+                    yield line
+        return
+
+    if os.path.getsize(log_file) == 0:
+        return
+    with open(log_file, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        separator = b"\n" + needle
+        if mm[:len(needle)] == needle:
+            start = 0
+        else:
+            found = mm.find(separator)
+            start = found + 1 if found != -1 else -1
+        while start != -1:
+            end = mm.find(b"\n", start)
+            if end == -1:
+                end = len(mm)
+            yield mm[start:end]
+            found = mm.find(separator, end)
+            start = found + 1 if found != -1 else -1
+
+
+# List the per-node log files of a dump folder, smallest first
+# nodenames: optional NODENAME globs, files of other nodes are not listed
+def list_log_files(folder, nodenames=None):
+    log_files = [f for extension in LOG_EXTENSIONS for f in glob.glob(os.path.join(folder, "*" + extension))]
+    match_node = compile_globs(nodenames)
+    if match_node is not None:
+        log_files = [f for f in log_files if match_node(get_nodename(f))]
+    return sorted(log_files, key=os.path.getsize)
+
+
+# Build the frame of one node from its split KPI rows, one column per datetime header
+def _node_frame(nodename, temp_data, temp_datetime_headers):
+    temp_datetime_headers = sorted(temp_datetime_headers)
+
+    columns = ["NODENAME", "Object", "Counter"] + temp_datetime_headers
+    formatted_data = []
     
-    # Read all log files in the directory
-    log_files = sorted(glob.glob(os.path.join(folder, "*.log")), key=os.path.getsize)
-    for log_file in log_files:
-        nodename = os.path.splitext(os.path.basename(log_file))[0]
-        temp_data = []
-        temp_datetime_headers = set()
-        
-        with open(log_file, "r") as file:
-            lines = file.readlines()
-            
-            for line in lines:
-                if line.startswith(pattern):
-                    parts = line.strip().rstrip(";").split("; ")
-                    
-                    if "Object" in parts and "Counter" in parts:
-                        temp_datetime_headers.update(parts[3:])
-                    else:
-                        temp_data.append(parts[1:])
-        
-        #######
-        if temp_data:
-            datetime_headers.update(temp_datetime_headers)
-            temp_datetime_headers = sorted(temp_datetime_headers)
-            
+    for row in temp_data:
+        row_dict = {"NODENAME": nodename, "Object": row[0], "Counter": row[1]}
+        for dt in temp_datetime_headers:
+            row_dict[dt] = "N/A"
+        for i, dt in enumerate(row[2:]):
+            if i < len(temp_datetime_headers):
+                row_dict[temp_datetime_headers[i]] = dt
+        formatted_data.append(row_dict)
 
-            columns = ["NODENAME", "Object", "Counter"] + temp_datetime_headers
-            formatted_data = []
-            
-            for row in temp_data:
-                row_dict = {"NODENAME": nodename, "Object": row[0], "Counter": row[1]}
-                for dt in temp_datetime_headers:
-                    row_dict[dt] = "N/A"
-                for i, dt in enumerate(row[2:]):
-                    if i < len(temp_datetime_headers):
-                        row_dict[temp_datetime_headers[i]] = dt
-                formatted_data.append(row_dict)
-
-
-            # Identify datetime columns based on format "YYYY-MM-DD HH:MM"
-            datetime_mapping = {}
-            temp_df = pd.DataFrame(formatted_data, columns=columns)
-            for col in temp_df.columns:
-                try:
-                    datetime_format = "%Y-%m-%d %H:%M"
-                    dt = pd.to_datetime(col, format=datetime_format, errors='raise')
-                    datetime_mapping[col] = dt.strftime(datetime_format)  # Store as string
-                except ValueError:
-                    pass  # Ignore non-datetime columns        
-            
-            temp_df.columns = [datetime_mapping[col] if col in datetime_mapping else col for col in temp_df.columns]
-            all_data.append(temp_df)
-        
-        
-        
-        
-    max_rop = 68
+
+    # Identify datetime columns based on format "YYYY-MM-DD HH:MM"
+    datetime_mapping = {}
+    temp_df = pd.DataFrame(formatted_data, columns=columns)
+    for col in temp_df.columns:
+        try:
+            datetime_format = "%Y-%m-%d %H:%M"
+            dt = pd.to_datetime(col, format=datetime_format, errors='raise')
+            datetime_mapping[col] = dt.strftime(datetime_format)  # Store as string
+        except ValueError:
+            pass  # Ignore non-datetime columns        
+    
+    temp_df.columns = [datetime_mapping[col] if col in datetime_mapping else col for col in temp_df.columns]
+    return temp_df
+
+
+# Concatenate the node frames of one pattern, keeping max_rop ROPs from start_defined on
+def _combine_node_frames(all_data, datetime_headers, start_defined, max_rop):
     if start_defined == "NO_START":
         datetime_candidates = sorted(datetime_headers)
     else:
@@ -78,7 +145,7 @@ def process_kpi_logs(folder, pattern, start_defined):
             col for col in datetime_headers
             if pd.to_datetime(col, format='%Y-%m-%d %H:%M', errors='coerce') >= pd.Timestamp(start_defined)
         ])
-    datetime_headers = datetime_candidates[:max_rop]
+    datetime_headers = datetime_candidates[:max_rop] if max_rop else datetime_candidates
         
     final_columns = ["NODENAME", "Object", "Counter"] + datetime_headers
     # If no data was collected, return an empty DataFrame with the expected columns
@@ -90,6 +157,76 @@ def process_kpi_logs(folder, pattern, start_defined):
     return df
 
 
+# Function to process KPI log files for several line patterns in a single pass over the logs
+# Returns a dict of pattern -> DataFrame
+# progress_callback, when given, is called with the path of each log file once it is parsed
+# nodenames, counters and objects are optional glob lists pushed down into parsing:
+# non-matching node files are never opened and non-matching rows are never split or stored
+# max_rop: number of ROPs kept from start_defined on, None or 0 for all
+def process_kpi_logs_multi(folder, patterns, start_defined, progress_callback=None, nodenames=None, counters=None, objects=None, max_rop=MAX_ROP):
+    patterns = list(dict.fromkeys(patterns))
+    all_data = {pattern: [] for pattern in patterns}
+    datetime_headers = {pattern: set() for pattern in patterns}
+    match_counter = compile_globs(counters)
+    match_object = compile_globs(objects)
+    # Every KPI line starts with the common prefix of the patterns, e.g. GREP_KPI_
+    needle = os.path.commonprefix(patterns).encode()
+    
+    # Read all log files in the directory
+    log_files = list_log_files(folder, nodenames)
+    for log_file in log_files:
+        nodename = get_nodename(log_file)
+        temp_data = {pattern: [] for pattern in patterns}
+        temp_datetime_headers = {pattern: set() for pattern in patterns}
+        
+        for raw_line in iter_prefixed_lines(log_file, needle):
+            line = raw_line.decode("utf-8", errors="replace")
+            matched = [pattern for pattern in patterns if line.startswith(pattern)]
+            if not matched:
+                continue
+
+            if match_counter is not None or match_object is not None:
+                # Only split off Object and Counter to decide whether the row is kept
+                head = line.split("; ", 3)
+                if len(head) > 2 and not (head[1] == "Object" and head[2] == "Counter"):
+                    row_object = head[1].strip().rstrip(";")
+                    row_counter = head[2].strip().rstrip(";")
+                    if match_object is not None and not match_object(row_object):
+                        continue
+                    if match_counter is not None and not match_counter(row_counter):
+                        continue
+
+            parts = line.strip().rstrip(";").split("; ")
+            
+            for pattern in matched:
+                if "Object" in parts and "Counter" in parts:
+                    temp_datetime_headers[pattern].update(parts[3:])
+                else:
+                    temp_data[pattern].append(parts[1:])
+        
+        #######
+        for pattern in patterns:
+            if temp_data[pattern]:
+                datetime_headers[pattern].update(temp_datetime_headers[pattern])
+                all_data[pattern].append(_node_frame(nodename, temp_data[pattern], temp_datetime_headers[pattern]))
+
+        if progress_callback is not None:
+            progress_callback(log_file)
+
+    return {
+        pattern: _combine_node_frames(all_data[pattern], datetime_headers[pattern], start_defined, max_rop)
+        for pattern in patterns
+    }
+
+
+# Function to process KPI log files
+def process_kpi_logs(folder, pattern, start_defined, progress_callback=None, nodenames=None, counters=None, objects=None, max_rop=MAX_ROP):
+    return process_kpi_logs_multi(
+        folder, [pattern], start_defined,
+        progress_callback=progress_callback, nodenames=nodenames, counters=counters, objects=objects, max_rop=max_rop,
+    )[pattern]
+
+
 # Merge BEFORE and AFTER datasets for comparison
 def create_main_merge_df(before_df, after_df):
     columns_to_keep = {"NODENAME", "Object", "Counter"}
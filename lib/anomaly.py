@@ -0,0 +1,116 @@
+import os
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from lib.engine import ID_COLUMNS, get_date_columns, split_by_counter
+
+
+ANOMALY_COLUMNS = ID_COLUMNS + [
+    "Window", "Datetime", "value", "peer_median", "peer_z", "baseline_median", "baseline_z", "score",
+]
+
+
+# NaN-ignoring median from one sort along the axis; faster than np.nanmedian on wide matrices
+def _nanmedian(values, axis):
+    ordered = np.sort(values, axis=axis)  # NaN sorts last
+    count = np.sum(~np.isnan(values), axis=axis, keepdims=True)
+    low = np.take_along_axis(ordered, np.maximum((count - 1) // 2, 0), axis=axis)
+    high = np.take_along_axis(ordered, count // 2, axis=axis)
+    return np.where(count > 0, (low + high) / 2, np.nan)
+
+
+# Robust spread: 1.4826 * MAD, falling back to 1.2533 * mean absolute deviation when MAD is 0
+# (e.g. most peers report the same value), NaN when the values do not vary at all
+def _robust_scale(values, center, axis):
+    deviation = np.abs(values - center)
+    scale = 1.4826 * _nanmedian(deviation, axis)
+    mean_scale = 1.2533 * np.nanmean(deviation, axis=axis, keepdims=True)
+    scale = np.where(scale > 0, scale, mean_scale)
+    return np.where(scale > 0, scale, np.nan)
+
+
+def _robust_z(values, axis):
+    with warnings.catch_warnings():
+        # All-NaN slices just give NaN statistics
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        center = _nanmedian(values, axis)
+        scale = _robust_scale(values, center, axis)
+    with np.errstate(invalid="ignore"):
+        return center, (values - center) / scale
+
+
+# Per-row BEFORE baseline (median and robust spread over its ROPs) aligned to the rows of another window
+def _baseline(before_rows, rows, date_columns):
+    keys = ["NODENAME", "Object"]
+    before_values = before_rows[get_date_columns(before_rows)].to_numpy(dtype=float)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        center = _nanmedian(before_values, 1)
+        scale = _robust_scale(before_values, center, axis=1)
+    stats = before_rows[keys].assign(center=center[:, 0], scale=scale[:, 0]).drop_duplicates(keys)
+    aligned = rows[keys].merge(stats, on=keys, how="left")
+    return aligned["center"].to_numpy()[:, None], aligned["scale"].to_numpy()[:, None]
+
+
+def _scan_counter(window, rows, before_rows, date_columns, threshold):
+    values = rows[date_columns].to_numpy(dtype=float)
+    # Robust z-score of every node against its peers, per ROP
+    peer_median, peer_z = _robust_z(values, axis=0)
+    peer_median = np.broadcast_to(peer_median, values.shape)
+
+    # Robust z-score of every node against its own BEFORE baseline
+    if before_rows is not None:
+        baseline_median, baseline_scale = _baseline(before_rows, rows, date_columns)
+        with np.errstate(invalid="ignore"):
+            baseline_z = (values - baseline_median) / baseline_scale
+        baseline_median = np.broadcast_to(baseline_median, values.shape)
+    else:
+        baseline_median = np.full(values.shape, np.nan)
+        baseline_z = np.full(values.shape, np.nan)
+
+    score = np.fmax(np.abs(peer_z), np.abs(baseline_z))
+    row_idx, col_idx = np.nonzero(score >= threshold)
+    if len(row_idx) == 0:
+        return None
+
+    anomalies = {col: rows[col].to_numpy()[row_idx] for col in ID_COLUMNS}
+    anomalies["Window"] = window
+    anomalies["Datetime"] = np.asarray(date_columns, dtype=object)[col_idx]
+    anomalies["value"] = values[row_idx, col_idx]
+    anomalies["peer_median"] = peer_median[row_idx, col_idx]
+    anomalies["peer_z"] = peer_z[row_idx, col_idx]
+    anomalies["baseline_median"] = baseline_median[row_idx, col_idx]
+    anomalies["baseline_z"] = baseline_z[row_idx, col_idx]
+    anomalies["score"] = score[row_idx, col_idx]
+    return pd.DataFrame(anomalies, columns=ANOMALY_COLUMNS)
+
+
+def scan_anomalies(before, after, threshold=3.5):
+    """
+    Anomalous values across all nodes, counters and ROPs of both windows.
+    before/after: numeric KPI frames (see lib.engine.to_numeric_frame)
+    peer_z: robust z-score of a value against all nodes for the same Counter and ROP
+    baseline_z: robust z-score of an AFTER value against the same row's BEFORE values
+    Values with |peer_z| or |baseline_z| >= threshold are returned, highest score first.
+    Each counter is scanned as one nodes x ROPs matrix.
+    """
+    before_groups = split_by_counter(before)
+    tasks = []
+    for window, numeric in (("BEFORE", before), ("AFTER", after)):
+        date_columns = get_date_columns(numeric)
+        if not date_columns:
+            continue
+        for counter, rows in split_by_counter(numeric).items():
+            before_rows = before_groups.get(counter) if window == "AFTER" else None
+            tasks.append((window, rows, before_rows, date_columns, threshold))
+
+    # numpy releases the GIL while sorting, so counters are scanned on several threads
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+        found = [anomalies for anomalies in executor.map(lambda task: _scan_counter(*task), tasks) if anomalies is not None]
+
+    if not found:
+        return pd.DataFrame(columns=ANOMALY_COLUMNS)
+    return pd.concat(found, ignore_index=True).sort_values("score", ascending=False, ignore_index=True)
@@ -0,0 +1,110 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from lib.engine import ID_COLUMNS, get_date_columns
+from lib.formulas import evaluate_formula_rows
+
+
+STAT_COLUMNS = ["n", "mean", "median", "var"]
+
+
+# Per-row sample statistics over the ROP columns of a numeric KPI frame
+def window_stats(numeric):
+    values = numeric[get_date_columns(numeric)].to_numpy(dtype=float)
+    stats = numeric[ID_COLUMNS].copy()
+    with warnings.catch_warnings():
+        # All-NaN rows and single samples just give NaN statistics
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        stats["n"] = (~np.isnan(values)).sum(axis=1)
+        stats["mean"] = np.nanmean(values, axis=1) if values.size else np.nan
+        stats["median"] = np.nanmedian(values, axis=1) if values.size else np.nan
+        stats["var"] = np.nanvar(values, axis=1, ddof=1) if values.size else np.nan
+    # A (NODENAME, Object, Counter) reported twice keeps its first row
+    return stats.drop_duplicates(ID_COLUMNS)
+
+
+# Two-sided p-value of a standard normal statistic, erfc approximated per Abramowitz & Stegun 7.1.26
+def _two_sided_p_value(z):
+    x = np.abs(z) / np.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return poly * np.exp(-x * x)
+
+
+def compare_windows(before, after):
+    """
+    BEFORE vs AFTER statistics for every (NODENAME, Object, Counter) in one batched pass.
+    before/after: numeric KPI frames (see lib.engine.to_numeric_frame)
+    Returns mean/median of both windows, their deltas, the percentage change of the mean
+    and a Welch t statistic with its two-sided p-value (normal approximation).
+    """
+    stats_before = window_stats(before).rename(columns={col: f"{col}_BEFORE" for col in STAT_COLUMNS})
+    stats_after = window_stats(after).rename(columns={col: f"{col}_AFTER" for col in STAT_COLUMNS})
+    result = stats_before.merge(stats_after, on=ID_COLUMNS, how="outer")
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result["delta_mean"] = result["mean_AFTER"] - result["mean_BEFORE"]
+        result["delta_median"] = result["median_AFTER"] - result["median_BEFORE"]
+        pct_change = result["delta_mean"] / result["mean_BEFORE"].abs() * 100
+        result["pct_change"] = pct_change.replace([np.inf, -np.inf], np.nan)
+
+        standard_error = np.sqrt(result["var_BEFORE"] / result["n_BEFORE"] + result["var_AFTER"] / result["n_AFTER"])
+        t_stat = (result["delta_mean"] / standard_error).replace([np.inf, -np.inf], np.nan)
+    result["t_stat"] = t_stat
+    p_value = _two_sided_p_value(t_stat.to_numpy(dtype=float))
+    # Both windows constant but different (e.g. 100 -> 0): no spread, so the change is certain
+    constant_change = (standard_error == 0) & (result["delta_mean"] != 0) & result["delta_mean"].notna()
+    result["p_value"] = np.where(constant_change, 0.0, p_value)
+
+    return result.drop(columns=["var_BEFORE", "var_AFTER"])
+
+
+def rank_degradation(comparison, lower_is_better=(), alpha=0.05):
+    """
+    Rank a compare_windows result so the worst-degraded rows come first.
+    degradation is the percentage change oriented so that positive means worse:
+    a drop for counters where higher is better, a rise for counters in lower_is_better.
+    significant (p_value < alpha) only breaks ties between equal degradations.
+    """
+    ranked = comparison.copy()
+    sign = np.where(ranked["Counter"].isin(list(lower_is_better)), 1.0, -1.0)
+    ranked["degradation"] = ranked["pct_change"] * sign
+    ranked["significant"] = ranked["p_value"] < alpha
+    ranked = ranked.sort_values(["degradation", "significant"], ascending=[False, False], na_position="last")
+    return ranked.reset_index(drop=True)
+
+
+# Counter x NODENAME mean over all objects and ROPs, from per-row sums in one pass
+# A derived KPI is its expression over the means of its counters, not the mean of its per-row values
+def _node_means(numeric, formulas=None):
+    values = numeric[get_date_columns(numeric)].to_numpy(dtype=float)
+    totals = numeric[["Counter", "NODENAME"]].assign(
+        total=np.nansum(values, axis=1) if values.size else 0.0,
+        count=(~np.isnan(values)).sum(axis=1) if values.size else 0,
+    )
+    grouped = totals.groupby(["Counter", "NODENAME"], sort=False)[["total", "count"]].sum()
+    means = (grouped["total"] / grouped["count"].replace(0, np.nan)).unstack("NODENAME")
+    if formulas:
+        means = pd.concat([means, evaluate_formula_rows(means, formulas)])
+    return means
+
+
+def change_matrix(before, after, lower_is_better=(), formulas=None):
+    """
+    BEFORE -> AFTER percentage change of the mean of every counter and node, as one Counter x NODENAME matrix.
+    before/after: numeric KPI frames of the parsed counters (see lib.engine.to_numeric_frame)
+    formulas: optional derived KPIs (name -> expression) added as rows
+    Returns (pct_change, severity): severity is the change oriented as in rank_degradation, positive meaning worse.
+    Rows and columns are sorted by their worst severity, nodes or counters without data last.
+    """
+    before_mean, after_mean = _node_means(before, formulas).align(_node_means(after, formulas), join="outer")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct_change = ((after_mean - before_mean) / before_mean.abs() * 100).replace([np.inf, -np.inf], np.nan)
+
+    sign = np.where(pct_change.index.isin(list(lower_is_better)), 1.0, -1.0)
+    severity = pct_change.mul(sign, axis=0)
+    rows = severity.max(axis=1).sort_values(ascending=False, na_position="last").index
+    columns = severity.max(axis=0).sort_values(ascending=False, na_position="last").index
+    return pct_change.loc[rows, columns], severity.loc[rows, columns]
@@ -0,0 +1,225 @@
+import os
+import queue
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from lib.engine import AGG_FUNCS, to_numeric_frame
+from lib.formulas import append_derived, evaluate_formulas
+from lib.rollup import RESOLUTIONS, rollup_frame
+
+
+# Parsed datasets kept in memory once the last session stopped using them, in MB
+DATASET_MEMORY_BUDGET_MB = int(os.environ.get("KPI_DATASET_MEMORY_MB", "2048"))
+# Derived results (rollups, statistics, ...) cached per dataset, in MB; least recently used ones are dropped first
+DATASET_CACHE_MB = int(os.environ.get("KPI_DATASET_CACHE_MB", "512"))
+
+_datasets = {}
+_datasets_lock = threading.Lock()
+# Ids released by garbage-collected handles, applied under _datasets_lock by the next registry call.
+# A finalizer may run in a thread already holding _datasets_lock, so it must never take it itself.
+_released = queue.SimpleQueue()
+
+
+# Approximate memory of a cached value: frames, arrays and containers of them
+def _nbytes(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(value, pd.DataFrame) else int(usage)
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_nbytes(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class KPIDataset:
+    """
+    One parsed upload shared by every session that opens it.
+    frames: dict of result key -> DataFrame, treated as read-only
+    """
+
+    def __init__(self, dataset_id, name, frames):
+        self.id = dataset_id
+        self.name = name
+        self.frames = frames
+        self.created = time.time()
+        self.last_used = self.created
+        self.refcount = 0
+        self.frames_nbytes = sum(int(frame.memory_usage(deep=True).sum()) for frame in frames.values())
+        self._cache = OrderedDict()
+        self._cache_nbytes = 0
+        self._cache_lock = threading.Lock()
+
+    # Memory of the parsed frames plus everything cached from them, as seen by dataset eviction
+    @property
+    def nbytes(self):
+        return self.frames_nbytes + self._cache_nbytes
+
+    def frame(self, key):
+        return self.frames.get(key, pd.DataFrame())
+
+    def cached(self, key, compute):
+        """
+        Result of compute() shared by every session of this dataset.
+        key must identify everything compute depends on besides the dataset itself.
+        Results are kept within DATASET_CACHE_MB, least recently used first out.
+        """
+        with self._cache_lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key][0]
+        value = compute()
+        nbytes = _nbytes(value)
+        budget = DATASET_CACHE_MB * 1024 * 1024
+        with self._cache_lock:
+            if key in self._cache:
+                return self._cache[key][0]
+            if nbytes > budget:
+                return value
+            self._cache[key] = (value, nbytes)
+            self._cache_nbytes += nbytes
+            while self._cache_nbytes > budget:
+                _, (_, dropped) = self._cache.popitem(last=False)
+                self._cache_nbytes -= dropped
+        # The cache grew; idle datasets may now have to make room
+        with _datasets_lock:
+            _evict_unreferenced(keep=self.id)
+        return value
+
+    # Numeric rows of a frame plus the derived KPIs of a formula set (tuple of (name, expression))
+    # Only the derived rows are cached per formula set; they are appended to the shared numeric rows on demand
+    def numeric_frame(self, key, formulas=()):
+        numeric = self.cached(("numeric", key), lambda: to_numeric_frame(self.frame(key)))
+        if not formulas:
+            return numeric
+        return append_derived(numeric, self._derived(key, formulas))
+
+    def _derived(self, key, formulas):
+        return self.cached(("derived", key, formulas), lambda: evaluate_formulas(self.numeric_frame(key), dict(formulas)))
+
+    # Counter names parsed in any frame, e.g. to check derived KPI definitions against
+    def counters(self):
+        return self.cached(("counters",), lambda: sorted(set().union(
+            *(frame["Counter"].unique() for frame in self.frames.values() if not frame.empty)
+        )))
+
+    # Numeric rows of a frame rolled up to a time resolution with an aggregation method
+    # Derived KPIs are evaluated on the rolled-up counters, e.g. a SUM ratio is sum(succ) / sum(att)
+    def rollup(self, key, resolution, method, formulas=()):
+        if resolution == "RAW":
+            return self.numeric_frame(key, formulas)
+        rolled = self.cached(("rollup", key, resolution, method),
+                             lambda: rollup_frame(self.numeric_frame(key), resolution, method))
+        if not formulas:
+            return rolled
+        derived = self.cached(("rollup", key, resolution, method, formulas),
+                              lambda: evaluate_formulas(rolled, dict(formulas)))
+        return append_derived(rolled, derived)
+
+    # Build the rollup pyramid of every frame up front, so pages never wait for it
+    def build_rollups(self):
+        for key in self.frames:
+            for resolution in RESOLUTIONS:
+                for method in AGG_FUNCS:
+                    self.rollup(key, resolution, method)
+
+
+class DatasetHandle:
+    """
+    Session-side reference to a shared dataset.
+    The reference is released when the handle is garbage collected, e.g. when the session ends.
+    """
+
+    def __init__(self, dataset):
+        self.id = dataset.id
+        self.dataset = dataset
+        self._finalizer = weakref.finalize(self, release_dataset, dataset.id)
+
+    def release(self):
+        self._finalizer()
+        with _datasets_lock:
+            _evict_unreferenced()
+
+
+# Apply the releases queued by handles; returns whether there were any. Caller holds _datasets_lock
+def _apply_releases():
+    applied = False
+    while True:
+        try:
+            dataset_id = _released.get_nowait()
+        except queue.Empty:
+            return applied
+        applied = True
+        dataset = _datasets.get(dataset_id)
+        if dataset is not None:
+            dataset.refcount = max(0, dataset.refcount - 1)
+            dataset.last_used = time.time()
+
+
+# Drop unreferenced datasets, least recently used first, until the memory budget is met
+# Caller holds _datasets_lock
+def _evict_unreferenced(keep=None):
+    _apply_releases()
+    budget = DATASET_MEMORY_BUDGET_MB * 1024 * 1024
+    total = sum(dataset.nbytes for dataset in _datasets.values())
+    idle = sorted(
+        (ds for ds in _datasets.values() if ds.refcount == 0 and ds.id != keep),
+        key=lambda ds: ds.last_used,
+    )
+    for dataset in idle:
+        if total <= budget:
+            break
+        total -= dataset.nbytes
+        del _datasets[dataset.id]
+
+
+# Register a parsed dataset under its content hash (its id); an already registered one is returned instead
+def register_dataset(dataset):
+    with _datasets_lock:
+        registered = _datasets.get(dataset.id)
+        if registered is None:
+            registered = _datasets[dataset.id] = dataset
+            # The new dataset is not referenced yet, keep it until a session acquires it
+            _evict_unreferenced(keep=dataset.id)
+        return registered
+
+
+def find_dataset(dataset_id):
+    with _datasets_lock:
+        if _apply_releases():
+            _evict_unreferenced()
+        return _datasets.get(dataset_id)
+
+
+# Take a reference on a dataset for a session; returns None if it was evicted
+def acquire_dataset(dataset_id):
+    with _datasets_lock:
+        if _apply_releases():
+            _evict_unreferenced()
+        dataset = _datasets.get(dataset_id)
+        if dataset is None:
+            return None
+        dataset.refcount += 1
+        dataset.last_used = time.time()
+    return DatasetHandle(dataset)
+
+
+# Drop a session's reference on a dataset; safe to call from any thread, including a garbage collector pass
+def release_dataset(dataset_id):
+    _released.put(dataset_id)
+
+
+# All registered datasets, newest first
+def list_datasets():
+    with _datasets_lock:
+        if _apply_releases():
+            _evict_unreferenced()
+        return sorted(_datasets.values(), key=lambda ds: ds.created, reverse=True)
@@ -0,0 +1,102 @@
+import pandas as pd
+
+
+# Columns identifying a KPI row; every other column is a ROP datetime
+ID_COLUMNS = ["NODENAME", "Object", "Counter"]
+
+AGG_FUNCS = {
+    'AVERAGE': 'mean',
+    'MAX': 'max',
+    'MIN': 'min',
+    'SUM': 'sum'
+}
+
+
+def get_date_columns(df):
+    return [col for col in df.columns if col not in ID_COLUMNS]
+
+
+# Copy of a parsed KPI frame with every ROP column converted to numbers ("N/A" becomes NaN)
+def to_numeric_frame(df):
+    date_columns = get_date_columns(df)
+    numeric = df[ID_COLUMNS].copy()
+    if date_columns:
+        values = df[date_columns].apply(pd.to_numeric, errors='coerce')
+        numeric = pd.concat([numeric, values], axis=1)
+    return numeric
+
+
+# Split a numeric KPI frame by counter once, so pages pick a counter without scanning the whole frame
+def split_by_counter(numeric):
+    if numeric.empty:
+        return {}
+    return {counter: group for counter, group in numeric.groupby('Counter', sort=False)}
+
+
+# Counters and nodenames offered by the pages of one technology; ROPs come from the aligned axis (lib.overlay)
+def technology_summary(before, after):
+    frames = [df for df in (before, after) if not df.empty]
+    counters = list(pd.unique(pd.concat([df['Counter'] for df in frames]))) if frames else []
+    nodenames = sorted(set().union(*(df['NODENAME'].unique() for df in frames))) if frames else []
+    return {
+        'counters': counters,
+        'nodenames': nodenames,
+    }
+
+
+# Helper function to aggregate data
+def aggregate_data(data, group_mode, method):
+    """
+    Aggregate data based on group mode and aggregation method
+    group_mode: 'ALL', 'NODENAME', 'OBJECT'
+    method: 'AVERAGE', 'MAX', 'MIN', 'SUM'
+    """
+    if data.empty:
+        return data
+
+    agg_func = AGG_FUNCS.get(method, 'mean')
+
+    # Identify date columns (excluding NODENAME, Object, Counter)
+    date_columns = get_date_columns(data)
+    values = data[date_columns].apply(pd.to_numeric, errors='coerce')
+
+    # Perform aggregation based on group_mode
+    if group_mode == 'ALL':
+        # Single row for all aggregated data, keeping the first object and counter
+        aggregated = values.agg(agg_func).to_frame().T
+        aggregated.insert(0, 'NODENAME', 'ALL')
+        aggregated.insert(1, 'Object', data['Object'].iloc[0])
+        aggregated.insert(2, 'Counter', data['Counter'].iloc[0])
+        return aggregated
+
+    elif group_mode == 'NODENAME':
+        # Group by NODENAME, Object, and Counter, then aggregate date columns
+        group_cols = ['NODENAME', 'Object', 'Counter']
+        return pd.concat([data[group_cols], values], axis=1).groupby(group_cols)[date_columns].agg(agg_func).reset_index()
+
+    elif group_mode == 'OBJECT':
+        # Group by Object and Counter, then aggregate date columns
+        group_cols = ['Object', 'Counter']
+        aggregated = pd.concat([data[group_cols], values], axis=1).groupby(group_cols)[date_columns].agg(agg_func).reset_index()
+
+        # Add a placeholder for NODENAME since we're grouping by Object
+        aggregated['NODENAME'] = 'AGGREGATED_BY_OBJECT'
+        return aggregated
+
+    else:
+        # Default to no aggregation
+        return data
+
+
+# Rows of one counter restricted to the selected nodenames
+def select_counter(counter_groups, counter, nodenames):
+    data = counter_groups.get(counter)
+    if data is None:
+        return None
+    return data[data['NODENAME'].isin(nodenames)]
+
+
+# Lowest and highest n nodes of one ROP, ignoring non-numeric values
+def top_bottom(data, column, n=10):
+    datetime_data = data[['NODENAME', column]].dropna()
+    return datetime_data.nsmallest(n, column), datetime_data.nlargest(n, column)
@@ -0,0 +1,67 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Memory kept for built Plotly figures across all sessions, in MB
+FIGURE_CACHE_MB = int(os.environ.get("KPI_FIGURE_CACHE_MB", "256"))
+
+_figures = OrderedDict()
+_figures_bytes = 0
+_figures_lock = threading.Lock()
+
+
+# Short stable hash of a selection (e.g. nodenames) for figure keys; order does not matter
+def selection_hash(values):
+    return hashlib.sha1("\n".join(sorted(map(str, values))).encode()).hexdigest()
+
+
+# Approximate memory of a figure: the arrays of its traces plus a fixed overhead per trace
+def _figure_nbytes(fig):
+    nbytes = 4096
+    for trace in fig.data:
+        nbytes += 1024
+        for name in ("x", "y", "z", "customdata", "text", "hovertext"):
+            value = getattr(trace, name, None) if name in trace else None
+            if value is None:
+                continue
+            if isinstance(value, np.ndarray) and value.dtype != object:
+                nbytes += value.nbytes
+            else:
+                nbytes += 64 * np.size(value)
+    return nbytes
+
+
+def cached_figure(key, build):
+    """
+    Plotly figure for key, built by build() only when it is not cached yet.
+    key must identify everything the figure depends on: dataset id, filters, options.
+    Cached figures are treated as read-only and shared by every session;
+    the least recently used ones are dropped once FIGURE_CACHE_MB is exceeded.
+    build may return None (nothing to draw), which is not cached.
+    """
+    global _figures_bytes
+    with _figures_lock:
+        if key in _figures:
+            _figures.move_to_end(key)
+            return _figures[key][0]
+
+    fig = build()
+    if fig is None:
+        return None
+    nbytes = _figure_nbytes(fig)
+    budget = FIGURE_CACHE_MB * 1024 * 1024
+    with _figures_lock:
+        if key in _figures:
+            return _figures[key][0]
+        if nbytes <= budget:
+            _figures[key] = (fig, nbytes)
+            _figures_bytes += nbytes
+        while _figures_bytes > budget and _figures:
+            _, (_, dropped) = _figures.popitem(last=False)
+            _figures_bytes -= dropped
+    return fig
+
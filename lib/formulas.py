@@ -0,0 +1,176 @@
+import ast
+
+import numpy as np
+import pandas as pd
+
+from lib.engine import ID_COLUMNS, aggregate_data, get_date_columns, select_counter, split_by_counter
+
+
+# Operators allowed in derived KPI expressions, applied to whole numpy arrays
+_BINARY_OPERATORS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+    ast.Pow: np.power,
+}
+_UNARY_OPERATORS = {
+    ast.UAdd: np.positive,
+    ast.USub: np.negative,
+}
+
+
+# Check an expression only uses numbers, counter names, + - * / ** and parentheses; returns the counter names
+def _referenced_counters(tree, name):
+    counters = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            counters.append(node.id)
+        elif isinstance(node, ast.BinOp):
+            if type(node.op) not in _BINARY_OPERATORS:
+                raise ValueError(f"Derived KPI '{name}': operator {type(node.op).__name__} is not supported")
+        elif isinstance(node, ast.UnaryOp):
+            if type(node.op) not in _UNARY_OPERATORS:
+                raise ValueError(f"Derived KPI '{name}': operator {type(node.op).__name__} is not supported")
+        elif isinstance(node, ast.Constant):
+            if not isinstance(node.value, (int, float)) or isinstance(node.value, bool):
+                raise ValueError(f"Derived KPI '{name}': only numeric constants are allowed")
+        elif not isinstance(node, (ast.Expression, ast.Load, ast.operator, ast.unaryop)):
+            raise ValueError(f"Derived KPI '{name}': {type(node).__name__} is not allowed in formulas")
+    return list(dict.fromkeys(counters))
+
+
+def parse_formulas(text, counters=None):
+    """
+    Parse derived KPI definitions, one per line: NAME = expression over counters
+    e.g. RRC_SR = 100 * pmRrcConnEstabSucc / pmRrcConnEstabAtt
+    Blank lines and lines starting with # are ignored.
+    counters: optional counter names of the dataset; a derived KPI may then neither
+    reuse one of them as its name nor reference a counter outside them.
+    Returns a dict of name -> expression, raises ValueError on invalid lines.
+    """
+    counters = set(counters) if counters is not None else None
+    formulas = {}
+    for number, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        name, separator, expression = line.partition("=")
+        name, expression = name.strip(), expression.strip()
+        if not separator or not name or not expression:
+            raise ValueError(f"Line {number}: expected 'NAME = expression'")
+        try:
+            tree = ast.parse(expression, mode="eval")
+        except SyntaxError:
+            raise ValueError(f"Line {number}: invalid expression '{expression}'")
+        referenced = _referenced_counters(tree, name)
+        if not referenced:
+            raise ValueError(f"Line {number}: '{name}' does not reference any counter")
+        if name in formulas:
+            raise ValueError(f"Line {number}: '{name}' is defined twice")
+        if counters is not None:
+            if name in counters:
+                raise ValueError(f"Line {number}: '{name}' is already a counter, choose another name")
+            unknown = [counter for counter in referenced if counter not in counters]
+            if unknown:
+                raise ValueError(f"Line {number}: unknown counter(s) {', '.join(unknown)}")
+        formulas[name] = expression
+    return formulas
+
+
+def _evaluate(node, arrays):
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body, arrays)
+    if isinstance(node, ast.Name):
+        return arrays[node.id]
+    if isinstance(node, ast.Constant):
+        return float(node.value)
+    if isinstance(node, ast.UnaryOp):
+        return _UNARY_OPERATORS[type(node.op)](_evaluate(node.operand, arrays))
+    return _BINARY_OPERATORS[type(node.op)](_evaluate(node.left, arrays), _evaluate(node.right, arrays))
+
+
+def evaluate_formulas(numeric, formulas):
+    """
+    Evaluate derived KPIs over a numeric KPI frame (see lib.engine.to_numeric_frame).
+    Each counter is laid out as one (NODENAME, Object) x ROP matrix, so an expression is
+    computed for all nodes and ROPs at once. Division by zero gives NaN.
+    Returns rows in the same layout as the input, with the derived KPI name as Counter.
+    """
+    date_columns = get_date_columns(numeric)
+    counter_groups = split_by_counter(numeric)
+    derived = []
+    for name, expression in formulas.items():
+        tree = ast.parse(expression, mode="eval")
+        counters = _referenced_counters(tree, name)
+
+        # Align the referenced counters on the (NODENAME, Object) pairs reporting all of them
+        # A technology without one of the counters has no such KPI (parse_formulas reports unknown counters)
+        if any(counter not in counter_groups for counter in counters):
+            continue
+        matrices = [
+            counter_groups[counter].drop_duplicates(["NODENAME", "Object"]).set_index(["NODENAME", "Object"])[date_columns]
+            for counter in counters
+        ]
+        index = matrices[0].index
+        for matrix in matrices[1:]:
+            index = index.intersection(matrix.index)
+        arrays = {counter: matrix.reindex(index).to_numpy(dtype=float) for counter, matrix in zip(counters, matrices)}
+
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            values = np.broadcast_to(_evaluate(tree, arrays), (len(index), len(date_columns)))
+        values = np.where(np.isfinite(values), values, np.nan)
+
+        result = pd.DataFrame(values, index=index, columns=date_columns).reset_index()
+        result.insert(2, "Counter", name)
+        derived.append(result)
+
+    if not derived:
+        return pd.DataFrame(columns=ID_COLUMNS + date_columns)
+    return pd.concat(derived, ignore_index=True)
+
+
+def evaluate_formula_rows(values, formulas):
+    """
+    Evaluate derived KPIs over a frame with one row per counter, e.g. per-node means indexed by Counter.
+    Returns one row per derived KPI, indexed by its name, with the columns of values.
+    """
+    rows = {}
+    for name, expression in formulas.items():
+        tree = ast.parse(expression, mode="eval")
+        counters = _referenced_counters(tree, name)
+        if any(counter not in values.index for counter in counters):
+            continue
+        arrays = {counter: values.loc[counter].to_numpy(dtype=float) for counter in counters}
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            result = np.broadcast_to(_evaluate(tree, arrays), (len(values.columns),))
+        rows[name] = np.where(np.isfinite(result), result, np.nan)
+    return pd.DataFrame.from_dict(rows, orient="index", columns=values.columns)
+
+
+def aggregate_derived(counter_groups, name, expression, nodenames, group_mode, method):
+    """
+    Rows of one derived KPI aggregated as lib.engine.aggregate_data does for a counter.
+    The referenced counters are aggregated first and the expression is applied to the aggregates,
+    so e.g. 100 * succ / att with SUM is 100 * sum(succ) / sum(att), not a sum of percentages.
+    counter_groups: counter -> rows, as from split_by_counter
+    Returns None when a referenced counter has no rows for the nodenames.
+    """
+    counters = _referenced_counters(ast.parse(expression, mode="eval"), name)
+    parts = []
+    for counter in counters:
+        data = select_counter(counter_groups, counter, nodenames)
+        if data is None or data.empty:
+            return None
+        parts.append(aggregate_data(data, group_mode, method))
+    if group_mode == "ALL":
+        # aggregate_data keeps the first object of each counter; the single rows must line up
+        parts = [part.assign(Object=parts[0]["Object"].iloc[0]) for part in parts]
+    return evaluate_formulas(pd.concat(parts, ignore_index=True), {name: expression})
+
+
+# Numeric KPI frame with derived KPI rows (see evaluate_formulas) appended
+def append_derived(numeric, derived):
+    if derived.empty:
+        return numeric
+    return pd.concat([numeric, derived], ignore_index=True)
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from lib.KPI import MAX_ROP
+from lib.jobs import get_job, submit_path_job
+
+
+# Server folder polled for new dumps (folders with Before/After or ZIPs of them); empty to disable
+INGEST_DIR = os.environ.get("KPI_INGEST_DIR", "")
+# Seconds between two scans of INGEST_DIR
+INGEST_POLL_SECONDS = float(os.environ.get("KPI_INGEST_POLL_SECONDS", "30"))
+
+# Optional parse options of a dump, read from "<dump name>.json" next to it, e.g.
+# {"before_time": "2024-01-01 00:00", "after_time": "NO_START", "max_rop": 96, "nodenames": ["NODE01*"]}
+SETTINGS_SUFFIX = ".json"
+FILTER_SETTINGS = ["nodenames", "counters", "objects"]
+
+_entries = {}
+_candidates = {}
+_lock = threading.Lock()
+_watcher = None
+
+
+class IngestEntry:
+    """
+    A dump found in INGEST_DIR and the job parsing it.
+    signature changes whenever a file of the dump or its settings changes.
+    """
+
+    def __init__(self, path, signature):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.signature = signature
+        self.found = time.time()
+        self.job_id = None
+        self.dataset_id = None
+        self.error = None
+
+
+def ingest_enabled():
+    return bool(INGEST_DIR)
+
+
+def _settings_path(path):
+    return os.path.normpath(path) + SETTINGS_SUFFIX
+
+
+# Sizes and modification times of every file of a dump and of its settings file
+def _signature(path):
+    files = [path, _settings_path(path)]
+    if os.path.isdir(path):
+        files = [_settings_path(path)]
+        for root, _, names in os.walk(path):
+            files.extend(os.path.join(root, name) for name in names)
+    digest = hashlib.sha256()
+    for file in sorted(files):
+        try:
+            stat = os.stat(file)
+        except FileNotFoundError:
+            continue
+        digest.update(f"{os.path.relpath(file, path)}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+# before_time/after_time/max_rop/filters of a dump; raises ValueError on an invalid settings file
+def _read_settings(path):
+    settings = {"before_time": "NO_START", "after_time": "NO_START", "max_rop": MAX_ROP}
+    settings_path = _settings_path(path)
+    if os.path.isfile(settings_path):
+        with open(settings_path, encoding="utf-8") as f:
+            loaded = json.load(f)
+        name = os.path.basename(settings_path)
+        if not isinstance(loaded, dict):
+            raise ValueError(f"{name}: expected a JSON object")
+        for key in ("before_time", "after_time"):
+            if key in loaded and not isinstance(loaded[key], str):
+                raise ValueError(f"{name}: '{key}' must be a string")
+        # bool is an int subclass, but true/false is no ROP count; null keeps every ROP
+        max_rop = loaded.get("max_rop")
+        if max_rop is not None and (isinstance(max_rop, bool) or not isinstance(max_rop, int)):
+            raise ValueError(f"{name}: 'max_rop' must be an integer")
+        for key in FILTER_SETTINGS:
+            value = loaded.get(key)
+            if value and not isinstance(value, str) and not (
+                    isinstance(value, list) and all(isinstance(item, str) for item in value)):
+                raise ValueError(f"{name}: '{key}' must be a string or a list of strings")
+        settings.update({key: loaded[key] for key in ("before_time", "after_time", "max_rop") if key in loaded})
+        settings["filters"] = {
+            key: [loaded[key]] if isinstance(loaded[key], str) else list(loaded[key])
+            for key in FILTER_SETTINGS if loaded.get(key)
+        }
+    return settings
+
+
+# Dumps directly inside INGEST_DIR: folders and ZIP files, settings files and hidden entries skipped
+def _list_dumps():
+    dumps = []
+    for entry in sorted(os.scandir(INGEST_DIR), key=lambda entry: entry.name):
+        if entry.name.startswith(".") or entry.name.endswith(SETTINGS_SUFFIX):
+            continue
+        if entry.is_dir() or (entry.is_file() and entry.name.lower().endswith(".zip")):
+            dumps.append(entry.path)
+    return dumps
+
+
+def _submit(entry):
+    try:
+        settings = _read_settings(entry.path)
+    except (OSError, ValueError) as exc:
+        entry.job_id, entry.error = None, str(exc)
+        return None
+    options = json.dumps(settings, sort_keys=True)
+    dataset_id = hashlib.sha256(f"{entry.path}|{entry.signature}|{options}".encode()).hexdigest()
+    job = submit_path_job(entry.path, dataset_id, **settings)
+    entry.job_id, entry.dataset_id, entry.error = job.id, dataset_id, None
+    return job
+
+
+def poll_ingest_dir():
+    """
+    Scan INGEST_DIR once and queue every new or changed dump for background parsing.
+    A dump is only queued once its signature is the same on two consecutive scans,
+    so folders and ZIPs still being copied are not picked up half-written.
+    """
+    if not os.path.isdir(INGEST_DIR):
+        return
+    for path in _list_dumps():
+        signature = _signature(path)
+        with _lock:
+            entry = _entries.get(path)
+            if entry is not None and entry.signature == signature:
+                continue
+            if _candidates.get(path) != signature:
+                _candidates[path] = signature
+                continue
+            del _candidates[path]
+            entry = _entries[path] = IngestEntry(path, signature)
+            try:
+                _submit(entry)
+            except Exception as exc:
+                # One unreadable dump must not stop the scan; it is retried once its files change
+                entry.job_id, entry.error = None, str(exc)
+
+
+def _watch():
+    while True:
+        try:
+            poll_ingest_dir()
+        except Exception:
+            # The folder may be unmounted or being rotated; try again on the next scan
+            pass
+        time.sleep(INGEST_POLL_SECONDS)
+
+
+# Start polling INGEST_DIR in a daemon thread, once per process; returns False when ingest is disabled
+def start_ingest_watcher():
+    global _watcher
+    if not ingest_enabled():
+        return False
+    with _lock:
+        if _watcher is None:
+            _watcher = threading.Thread(target=_watch, name="kpi-ingest", daemon=True)
+            _watcher.start()
+    return True
+
+
+# Parse a known dump again, e.g. after its dataset was evicted from memory; returns the job or None
+def ingest_now(path):
+    with _lock:
+        entry = _entries.get(path)
+        if entry is None:
+            return None
+        entry.signature = _signature(path)
+        return _submit(entry)
+
+
+# Dumps found so far with the state of their job, newest first
+def list_ingested():
+    with _lock:
+        entries = sorted(_entries.values(), key=lambda entry: entry.found, reverse=True)
+    ingested = []
+    for entry in entries:
+        job = get_job(entry.job_id) if entry.job_id else None
+        info = job.snapshot() if job is not None else {}
+        ingested.append({
+            "path": entry.path,
+            "name": entry.name,
+            "status": info.get("status", "failed" if entry.error else "unknown"),
+            "progress": info.get("progress", 0.0),
+            "message": info.get("message", ""),
+            "error": entry.error or info.get("error"),
+            "dataset_id": entry.dataset_id,
+        })
+    return ingested
@@ -0,0 +1,276 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from lib.KPI import KPI_TECHNOLOGIES, KPI_WINDOWS, MAX_ROP, frame_key, list_log_files, process_kpi_logs_multi
+from lib.datastore import KPIDataset, find_dataset, register_dataset
+from lib.store import save_dataset, store_enabled
+from lib.reports import REPORT_DIR, REPORT_FORMATS, write_node_reports
+
+
+# Number of uploads parsed concurrently; further jobs wait in the executor queue
+MAX_WORKERS = int(os.environ.get("KPI_JOB_WORKERS", "2"))
+# Finished jobs kept around so a reconnecting browser can still pick up the result
+MAX_FINISHED_JOBS = 20
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="kpi-job")
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class KPIJob:
+    """
+    State of one background job: an upload parse, a query store load or a report build.
+    status: 'queued', 'running', 'done', 'failed'
+    """
+
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.created = time.time()
+        self.status = "queued"
+        self.progress = 0.0
+        self.message = "Waiting for a free worker..."
+        self.dataset_id = None
+        # File produced by the job, e.g. a report ZIP; deleted when the job is pruned
+        self.output_path = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def update(self, **fields):
+        with self._lock:
+            for key, value in fields.items():
+                setattr(self, key, value)
+
+    def snapshot(self):
+        # Consistent copy of the fields shown on the page
+        with self._lock:
+            return {
+                "id": self.id,
+                "name": self.name,
+                "created": self.created,
+                "status": self.status,
+                "progress": self.progress,
+                "message": self.message,
+                "error": self.error,
+            }
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+
+def _prune_finished_jobs():
+    with _jobs_lock:
+        finished = sorted((job for job in _jobs.values() if job.finished), key=lambda job: job.created)
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del _jobs[job.id]
+            if job.output_path and os.path.exists(job.output_path):
+                os.remove(job.output_path)
+
+
+# Folder holding the Before and After directories: the dump itself or its only subfolder,
+# as when a dump folder was zipped as a whole
+def find_dump_root(path):
+    if os.path.isdir(os.path.join(path, "Before")) or os.path.isdir(os.path.join(path, "After")):
+        return path
+    subfolders = [entry.path for entry in os.scandir(path) if entry.is_dir()]
+    if len(subfolders) == 1:
+        return find_dump_root(subfolders[0])
+    return path
+
+
+# Parse an extracted dump folder, reporting real per-file progress on the job
+# filters: optional process_kpi_logs glob filters (nodenames, counters, objects)
+def _parse_dump(job, root, before_time, after_time, filters, max_rop):
+    folder_before = os.path.join(root, "Before")
+    folder_after = os.path.join(root, "After")
+
+    # Validate that both directories exist in the extracted ZIP
+    if not os.path.isdir(folder_before):
+        raise ValueError(f"'Before' folder does not exist in the uploaded ZIP file: {folder_before}")
+    if not os.path.isdir(folder_after):
+        raise ValueError(f"'After' folder does not exist in the uploaded ZIP file: {folder_after}")
+
+    folders = {"BEFORE": folder_before, "AFTER": folder_after}
+    start_times = {"BEFORE": before_time, "AFTER": after_time}
+    total_files = max(1, sum(len(list_log_files(path, filters.get("nodenames"))) for path in folders.values()))
+    done_files = 0
+
+    # One pass per window finds the lines of every technology
+    results = {}
+    for window in KPI_WINDOWS:
+        def on_file(log_file, window=window):
+            nonlocal done_files
+            done_files += 1
+            job.update(
+                progress=done_files / total_files,
+                message=f"{window}: parsed {os.path.basename(log_file)} ({done_files}/{total_files} files)",
+            )
+
+        job.update(message=f"Processing {window} data...")
+        frames = process_kpi_logs_multi(
+            folders[window], KPI_TECHNOLOGIES.values(), start_times[window],
+            progress_callback=on_file, max_rop=max_rop, **filters
+        )
+        for technology, pattern in KPI_TECHNOLOGIES.items():
+            results[frame_key(technology, window)] = frames[pattern]
+    return results
+
+
+# Parse a dump folder into a shared dataset and finish the job with it
+def _build_dataset(job, dataset_id, root, before_time, after_time, filters, max_rop):
+    results = _parse_dump(job, root, before_time, after_time, filters, max_rop)
+    job.update(message="Building hourly and daily rollups...")
+    dataset = KPIDataset(dataset_id, job.name, results)
+    dataset.build_rollups()
+    register_dataset(dataset)
+    job.update(status="done", progress=1.0, message="Processing complete!", dataset_id=dataset_id)
+    if store_enabled():
+        # The dataset is usable right away; the query store is loaded by a job of its own
+        submit_store_job(dataset)
+
+
+def _run_upload_job(job, dataset_id, zip_path, work_dir, before_time, after_time, filters, max_rop):
+    job.update(status="running", message="Extracting ZIP file...")
+    try:
+        extract_dir = os.path.join(work_dir, "extracted")
+        with zipfile.ZipFile(zip_path, "r") as zip_ref:
+            zip_ref.extractall(extract_dir)
+        os.remove(zip_path)
+        _build_dataset(job, dataset_id, extract_dir, before_time, after_time, filters, max_rop)
+    except Exception as exc:
+        job.update(status="failed", message="Processing failed", error=str(exc))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        _prune_finished_jobs()
+
+
+def _run_path_job(job, dataset_id, path, before_time, after_time, filters, max_rop):
+    job.update(status="running")
+    work_dir = None
+    try:
+        root = path
+        if os.path.isfile(path):
+            # A ZIP on the server is extracted to a temporary folder; the original is left untouched
+            job.update(message="Extracting ZIP file...")
+            work_dir = tempfile.mkdtemp(prefix="kpi_job_")
+            root = os.path.join(work_dir, "extracted")
+            with zipfile.ZipFile(path, "r") as zip_ref:
+                zip_ref.extractall(root)
+        _build_dataset(job, dataset_id, find_dump_root(root), before_time, after_time, filters, max_rop)
+    except Exception as exc:
+        job.update(status="failed", message="Processing failed", error=str(exc))
+    finally:
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        _prune_finished_jobs()
+
+
+# Queue a dump already on the server (a folder with Before/After or a ZIP of one) for background parsing
+# Nothing passes through the browser; dataset_id must identify the dump content and parse options
+def submit_path_job(path, dataset_id, before_time="NO_START", after_time="NO_START", filters=None, max_rop=MAX_ROP):
+    filters = {key: list(value) for key, value in (filters or {}).items() if value}
+    job = KPIJob(os.path.basename(os.path.normpath(path)))
+    with _jobs_lock:
+        _jobs[job.id] = job
+    if find_dataset(dataset_id) is not None:
+        job.update(status="done", progress=1.0, message="Dataset already processed", dataset_id=dataset_id)
+        _prune_finished_jobs()
+    else:
+        _executor.submit(_run_path_job, job, dataset_id, path, before_time, after_time, filters, max_rop)
+    return job
+
+
+# Queue an uploaded ZIP for background parsing and return its job
+# The upload is spooled to disk so the job does not depend on the browser session,
+# and hashed on the way so an upload already parsed by any session is reused as is
+# filters: optional dict of process_kpi_logs glob filters (nodenames, counters, objects)
+# max_rop: number of ROPs kept per window, None or 0 for all
+def submit_upload_job(uploaded_file, before_time, after_time, filters=None, max_rop=MAX_ROP):
+    filters = {key: list(value) for key, value in (filters or {}).items() if value}
+    job = KPIJob(getattr(uploaded_file, "name", "upload.zip"))
+    work_dir = tempfile.mkdtemp(prefix="kpi_job_")
+    zip_path = os.path.join(work_dir, "upload.zip")
+    content_hash = hashlib.sha256(f"{before_time}|{after_time}|{sorted(filters.items())}|{max_rop}|".encode())
+    uploaded_file.seek(0)
+    with open(zip_path, "wb") as f:
+        for chunk in iter(lambda: uploaded_file.read(1024 * 1024), b""):
+            content_hash.update(chunk)
+            f.write(chunk)
+    dataset_id = content_hash.hexdigest()
+
+    with _jobs_lock:
+        _jobs[job.id] = job
+    if find_dataset(dataset_id) is not None:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        job.update(status="done", progress=1.0, message="Dataset already processed", dataset_id=dataset_id)
+        _prune_finished_jobs()
+    else:
+        _executor.submit(_run_upload_job, job, dataset_id, zip_path, work_dir, before_time, after_time, filters, max_rop)
+    return job
+
+
+def _run_report_job(job, dataset, formats):
+    job.update(status="running", message="Building node reports...")
+    output_path = os.path.join(REPORT_DIR, f"KPI_Node_Reports_{dataset.id[:12]}_{job.id[:8]}.zip")
+    try:
+        os.makedirs(REPORT_DIR, exist_ok=True)
+
+        def on_node(done, total):
+            job.update(progress=done / total, message=f"Built {done}/{total} node reports")
+
+        written = write_node_reports(dataset.frames, output_path, formats, progress_callback=on_node)
+        job.update(status="done", progress=1.0, message=f"{written} node reports ready", output_path=output_path)
+    except Exception as exc:
+        # Do not leave a partially written ZIP behind in REPORT_DIR
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        job.update(status="failed", message="Report generation failed", error=str(exc))
+    finally:
+        _prune_finished_jobs()
+
+
+# Queue per-node report bundles of a processed dataset, written into one ZIP (see lib.reports)
+def submit_report_job(dataset_id, formats=REPORT_FORMATS):
+    dataset = find_dataset(dataset_id)
+    job = KPIJob(f"{dataset.name if dataset is not None else 'dataset'} node reports")
+    with _jobs_lock:
+        _jobs[job.id] = job
+    if dataset is None:
+        job.update(status="failed", message="Report generation failed",
+                   error="The dataset is no longer available, please process it again.")
+    else:
+        _executor.submit(_run_report_job, job, dataset, list(formats))
+    return job
+
+
+def _run_store_job(job, dataset):
+    job.update(status="running", message="Loading into the query store...")
+    try:
+        rows = save_dataset(dataset)
+        job.update(status="done", progress=1.0, message=f"{rows} values stored", dataset_id=dataset.id)
+    except Exception as exc:
+        job.update(status="failed", message="Loading into the query store failed", error=str(exc))
+    finally:
+        _prune_finished_jobs()
+
+
+# Queue loading a processed dataset into the query store (see lib.store)
+def submit_store_job(dataset):
+    job = KPIJob(f"{dataset.name} query store load")
+    with _jobs_lock:
+        _jobs[job.id] = job
+    _executor.submit(_run_store_job, job, dataset)
+    return job
+
+
+def get_job(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+from lib.engine import ID_COLUMNS, get_date_columns
+
+
+# Name of the shared relative axis: offset from the start of each window, in ROPs (or buckets of a rollup)
+ROP_AXIS = "ROP"
+
+
+def rop_offsets(date_columns):
+    """
+    Offset of every date column of one window from its first column, in units of the window's ROP period.
+    The period is the smallest gap between two columns, so missing ROPs leave holes on the axis.
+    Columns that are not datetimes fall back to their position.
+    """
+    if not date_columns:
+        return np.zeros(0, dtype=int)
+    times = pd.to_datetime(pd.Series(date_columns), errors="coerce")
+    if times.isna().any() or len(times) < 2:
+        return np.arange(len(date_columns))
+    start = times.min()
+    gaps = np.diff(np.sort(times.unique()))
+    period = gaps.min() if len(gaps) else None
+    if not period:
+        return np.arange(len(date_columns))
+    return np.rint((times - start) / period).to_numpy(dtype=int)
+
+
+def rop_axis(window_columns):
+    """
+    Shared relative axis of several windows, e.g. {"BEFORE": [...], "AFTER": [...]}.
+    Returns a frame indexed by ROP offset with one column per window holding its
+    datetime column at that offset (None where the window has no ROP there).
+    """
+    offsets = {window: rop_offsets(columns) for window, columns in window_columns.items()}
+    length = max((int(window_offsets.max()) + 1 for window_offsets in offsets.values() if len(window_offsets)), default=0)
+    axis = pd.DataFrame(index=pd.RangeIndex(length, name=ROP_AXIS))
+    for window, columns in window_columns.items():
+        labels = np.full(length, None, dtype=object)
+        labels[offsets[window]] = columns
+        axis[window] = labels
+    return axis
+
+
+# Move the date columns of a numeric KPI frame onto the relative axis by one fancy-indexed assignment
+def align_frame(numeric, offsets, length):
+    values = numeric[get_date_columns(numeric)].to_numpy(dtype=float)
+    aligned = np.full((len(numeric), length), np.nan)
+    aligned[:, offsets] = values
+    result = numeric[ID_COLUMNS].reset_index(drop=True)
+    return pd.concat([result, pd.DataFrame(aligned, index=result.index, columns=pd.RangeIndex(length))], axis=1)
+
+
+def align_windows(frames):
+    """
+    Align the numeric KPI frames of several windows ({window: frame}) on a shared relative ROP axis.
+    Returns the axis (see rop_axis) and {window: frame} whose date columns are the axis offsets.
+    """
+    axis = rop_axis({window: get_date_columns(frame) for window, frame in frames.items()})
+    aligned = {
+        window: align_frame(frame, rop_offsets(get_date_columns(frame)), len(axis))
+        for window, frame in frames.items()
+    }
+    return axis, aligned
+
+
+# Offsets of an axis whose datetime, in any window, is among that window's selected columns
+def select_offsets(axis, selected_columns):
+    mask = np.zeros(len(axis), dtype=bool)
+    for window, columns in selected_columns.items():
+        mask |= axis[window].isin(list(columns)).to_numpy()
+    return axis.index[mask].tolist()
+
+
+def overlay_plot_data(aggregated, axis, offsets):
+    """
+    Long-form data of one overlay chart from aligned, aggregated rows of each window ({window: frame}).
+    Returns ROP, Datetime, NODENAME, Window, value columns as px.line expects with color and line_dash.
+    """
+    parts = []
+    for window, data in aggregated.items():
+        if data is None or data.empty:
+            continue
+        values = data[offsets].to_numpy(dtype=float)
+        parts.append(pd.DataFrame({
+            ROP_AXIS: np.tile(offsets, len(data)),
+            "Datetime": np.tile(axis.loc[offsets, window].to_numpy(), len(data)),
+            "NODENAME": np.repeat(data["NODENAME"].to_numpy(), len(offsets)),
+            "Window": window,
+            "value": values.ravel(),
+        }))
+    if not parts:
+        return pd.DataFrame(columns=[ROP_AXIS, "Datetime", "NODENAME", "Window", "value"])
+    return pd.concat(parts, ignore_index=True)
@@ -0,0 +1,159 @@
+import html
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+import plotly.express as px
+from plotly.offline import get_plotlyjs_version
+
+from lib.KPI import KPI_TECHNOLOGIES, KPI_WINDOWS, create_main_merge_df, frame_key
+from lib.compare import compare_windows
+from lib.engine import to_numeric_frame
+from lib.overlay import ROP_AXIS, align_windows, overlay_plot_data
+
+
+# Worker processes building node bundles; each holds only the rows of the nodes it is building
+REPORT_WORKERS = int(os.environ.get("KPI_REPORT_WORKERS", str(os.cpu_count() or 1)))
+# Folder the report ZIPs are written to
+REPORT_DIR = os.environ.get("KPI_REPORT_DIR", os.path.join(tempfile.gettempdir(), "kpi_reports"))
+
+REPORT_FORMATS = ["HTML", "XLSX"]
+
+
+# File name part of a NODENAME, safe for ZIP members on every platform
+def _safe_name(nodename):
+    return re.sub(r"[^\w.-]", "_", str(nodename))
+
+
+# Distinct file name part per NODENAME: _safe_name, suffixed with _2, _3, ... where two nodes would share one
+# (compared case-insensitively, as on Windows and macOS file systems)
+def _unique_names(nodenames):
+    names, used = {}, set()
+    for nodename in nodenames:
+        base = name = _safe_name(nodename)
+        suffix = 1
+        while name.lower() in used:
+            suffix += 1
+            name = f"{base}_{suffix}"
+        used.add(name.lower())
+        names[nodename] = name
+    return names
+
+
+def _node_xlsx(frames):
+    # Same sheets as the full report plus the create_main_merge_df comparison of every technology
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+        for key, frame in frames.items():
+            frame.to_excel(writer, sheet_name=key, index=False)
+        for technology in KPI_TECHNOLOGIES:
+            compare = create_main_merge_df(frames[frame_key(technology, "BEFORE")], frames[frame_key(technology, "AFTER")])
+            if compare is not None:
+                compare.to_excel(writer, sheet_name=f"Compare_{technology}", index=False)
+    return buffer.getvalue()
+
+
+def _node_html(nodename, frames):
+    title = html.escape(f"KPI report - {nodename}")
+    sections = [f"<h1>{title}</h1>"]
+    for technology in KPI_TECHNOLOGIES:
+        numeric = {window: to_numeric_frame(frames[frame_key(technology, window)]) for window in KPI_WINDOWS}
+        if all(frame.empty for frame in numeric.values()):
+            continue
+        sections.append(f"<h2>KPI {html.escape(technology)}</h2>")
+        comparison = compare_windows(numeric["BEFORE"], numeric["AFTER"]).drop(columns=["NODENAME"])
+        sections.append(comparison.to_html(index=False, float_format=lambda value: f"{value:.4g}", na_rep=""))
+
+        # One BEFORE vs AFTER overlay per counter, one line per object
+        axis, aligned = align_windows(numeric)
+        for counter in pd.unique(pd.concat([frame["Counter"] for frame in numeric.values()])):
+            rows = {
+                window: frame[frame["Counter"] == counter].assign(NODENAME=lambda df: df["Object"])
+                for window, frame in aligned.items()
+            }
+            plot_data = overlay_plot_data(rows, axis, axis.index.tolist())
+            if plot_data.empty:
+                continue
+            fig = px.line(plot_data, x=ROP_AXIS, y="value", color="NODENAME", line_dash="Window",
+                          hover_data=["Datetime"], title=f"BEFORE vs AFTER - {counter}",
+                          labels={"NODENAME": "Object", "value": "Counter Value", ROP_AXIS: "ROP offset from window start"})
+            sections.append(fig.to_html(full_html=False, include_plotlyjs=False))
+
+    return (
+        "<!DOCTYPE html><html><head><meta charset='utf-8'>"
+        f"<title>{title}</title>"
+        f"<script src='https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js'></script></head><body>"
+        + "\n".join(sections)
+        + "</body></html>"
+    ).encode("utf-8")
+
+
+# Runs in a worker process: every file of one node's bundle as (ZIP member name, bytes)
+# name: file name part of the node's members, unique within the ZIP (see _unique_names)
+def build_node_bundle(nodename, name, frames, formats):
+    files = []
+    if "XLSX" in formats:
+        files.append((f"{name}/{name}.xlsx", _node_xlsx(frames)))
+    if "HTML" in formats:
+        files.append((f"{name}/{name}.html", _node_html(nodename, frames)))
+    return files
+
+
+# (nodename, {frame key: that node's rows}) for every node, sliced lazily so only the nodes in flight are copied
+def _node_tasks(frames, nodenames):
+    positions = {key: frame.groupby("NODENAME", sort=False).indices if not frame.empty else {} for key, frame in frames.items()}
+    for nodename in nodenames:
+        yield nodename, {
+            key: frame.iloc[positions[key].get(nodename, [])].reset_index(drop=True)
+            for key, frame in frames.items()
+        }
+
+
+def write_node_reports(frames, output_path, formats=REPORT_FORMATS, nodenames=None, progress_callback=None,
+                       workers=REPORT_WORKERS):
+    """
+    Write one bundle per NODENAME (its frames and comparison as XLSX, its charts and statistics as HTML)
+    into a single ZIP at output_path.
+    frames: parsed KPI frames keyed by frame_key, e.g. KPIDataset.frames
+    Bundles are built in parallel worker processes and written to the ZIP as they complete;
+    at most two tasks per worker are in flight, so memory stays bounded for thousands of nodes.
+    progress_callback(done, total) is called after every node.
+    Returns the number of nodes written.
+    """
+    frames = {
+        frame_key(technology, window): frames.get(frame_key(technology, window), pd.DataFrame())
+        for technology in KPI_TECHNOLOGIES for window in KPI_WINDOWS
+    }
+    if nodenames is None:
+        nodenames = sorted(set().union(*(frame["NODENAME"].unique() for frame in frames.values() if not frame.empty)))
+    names = _unique_names(nodenames)
+    total = len(nodenames)
+    tasks = _node_tasks(frames, nodenames)
+    workers = max(1, min(workers, total))
+    done = 0
+
+    # spawn: the app process runs other threads, which fork would copy in an undefined state
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor, \
+            zipfile.ZipFile(output_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        pending = set()
+        while True:
+            for nodename, node_frames in tasks:
+                pending.add(executor.submit(build_node_bundle, nodename, names[nodename], node_frames, list(formats)))
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                for member, content in future.result():
+                    archive.writestr(member, content)
+                done += 1
+                if progress_callback:
+                    progress_callback(done, total)
+    return done
@@ -0,0 +1,70 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from lib.engine import AGG_FUNCS, ID_COLUMNS, get_date_columns
+
+
+# Time resolutions of the rollup pyramid, finest first
+RESOLUTIONS = ["RAW", "HOURLY", "DAILY"]
+
+# Charts aim for at most this many points per line when the resolution is picked automatically
+MAX_POINTS_PER_CHART = 200
+
+
+# Bucket label of a "YYYY-MM-DD HH:MM" ROP column at a resolution
+def bucket_label(column, resolution):
+    if resolution == "HOURLY":
+        return column[:13] + ":00"
+    if resolution == "DAILY":
+        return column[:10]
+    return column
+
+
+def _reduce(values, func):
+    with warnings.catch_warnings():
+        # Buckets without any value give NaN
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        if func == "mean":
+            return np.nanmean(values, axis=1)
+        if func == "max":
+            return np.nanmax(values, axis=1)
+        if func == "min":
+            return np.nanmin(values, axis=1)
+        count = np.sum(~np.isnan(values), axis=1)
+        return np.where(count > 0, np.nansum(values, axis=1), np.nan)
+
+
+def rollup_frame(numeric, resolution, method):
+    """
+    Roll the ROP columns of a numeric KPI frame up to HOURLY or DAILY buckets.
+    method: 'AVERAGE', 'MAX', 'MIN', 'SUM', applied over the ROPs of each bucket
+    Returns a frame in the same layout with one column per bucket.
+    """
+    if resolution == "RAW":
+        return numeric
+    func = AGG_FUNCS.get(method, "mean")
+    date_columns = sorted(get_date_columns(numeric))
+    values = numeric[date_columns].to_numpy(dtype=float)
+
+    buckets = {}
+    for position, column in enumerate(date_columns):
+        buckets.setdefault(bucket_label(column, resolution), []).append(position)
+    rolled = {label: _reduce(values[:, positions], func) for label, positions in buckets.items()}
+
+    result = numeric[ID_COLUMNS].reset_index(drop=True)
+    return pd.concat([result, pd.DataFrame(rolled, index=result.index)], axis=1)
+
+
+# Finest resolution showing the selected ROP columns with at most MAX_POINTS_PER_CHART points
+def pick_resolution(date_columns):
+    for resolution in RESOLUTIONS:
+        if len({bucket_label(col, resolution) for col in date_columns}) <= MAX_POINTS_PER_CHART:
+            return resolution
+    return RESOLUTIONS[-1]
+
+
+# Bucket columns of a resolution covering the selected raw ROP columns
+def resolution_columns(date_columns, resolution):
+    return list(dict.fromkeys(bucket_label(col, resolution) for col in date_columns))
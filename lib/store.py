@@ -0,0 +1,208 @@
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from lib.KPI import KPI_TECHNOLOGIES, KPI_WINDOWS, frame_key
+from lib.engine import get_date_columns
+
+
+# SQLite file processed uploads are loaded into for ad-hoc queries; empty (the default) to disable
+STORE_PATH = os.environ.get("KPI_STORE_PATH", "")
+
+# Rows returned by one query at most
+MAX_QUERY_ROWS = 10000
+# Values inserted per executemany call when loading a dataset
+INSERT_BATCH_VALUES = 100000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    dataset_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    created REAL NOT NULL,
+    rows INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS kpi (
+    dataset_id TEXT NOT NULL,
+    technology TEXT NOT NULL,
+    window TEXT NOT NULL,
+    nodename TEXT NOT NULL,
+    object TEXT NOT NULL,
+    counter TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    value REAL NOT NULL
+);
+"""
+
+# Created after the first bulk insert rather than with the table, so that load does not maintain them row by row
+_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS kpi_counter_node_ts ON kpi (counter, nodename, ts)",
+    "CREATE INDEX IF NOT EXISTS kpi_node_ts ON kpi (nodename, ts)",
+    "CREATE INDEX IF NOT EXISTS kpi_ts ON kpi (ts)",
+    "CREATE INDEX IF NOT EXISTS kpi_dataset ON kpi (dataset_id, technology, window)",
+]
+
+# Columns a query can group by -> SQL expression; ROP datetimes are stored as "YYYY-MM-DD HH:MM" text
+GROUP_COLUMNS = {
+    "Dataset": "kpi.dataset_id",
+    "Technology": "kpi.technology",
+    "Window": "kpi.window",
+    "NODENAME": "kpi.nodename",
+    "Object": "kpi.object",
+    "Counter": "kpi.counter",
+    "Datetime": "kpi.ts",
+    "Hour": "substr(kpi.ts, 1, 13) || ':00'",
+    "Day": "substr(kpi.ts, 1, 10)",
+}
+
+SQL_AGG_FUNCS = {
+    "AVERAGE": "AVG",
+    "MAX": "MAX",
+    "MIN": "MIN",
+    "SUM": "SUM",
+}
+
+# Writers are serialized; readers run concurrently thanks to WAL mode
+_write_lock = threading.Lock()
+
+
+def store_enabled():
+    return bool(STORE_PATH)
+
+
+def _connect(path=None):
+    connection = sqlite3.connect(path or STORE_PATH, timeout=30, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(_SCHEMA)
+    return connection
+
+
+# (dataset_id, technology, window, nodename, object, counter, ts, value) rows of one numeric KPI frame, NaNs skipped,
+# in batches of about INSERT_BATCH_VALUES values so memory does not grow with the frame
+# The columns of a batch are gathered with numpy; only the final zip into row tuples runs per value
+def _long_row_batches(dataset_id, technology, window, numeric):
+    date_columns = get_date_columns(numeric)
+    if numeric.empty or not date_columns:
+        return
+    timestamps = np.asarray(date_columns, dtype=object)
+    step = max(1, INSERT_BATCH_VALUES // len(date_columns))
+    for start in range(0, len(numeric), step):
+        chunk = numeric.iloc[start:start + step]
+        values = chunk[date_columns].to_numpy(dtype=float)
+        row_idx, col_idx = np.nonzero(~np.isnan(values))
+        count = len(row_idx)
+        if not count:
+            continue
+        ids = [chunk[column].astype(str).to_numpy()[row_idx].tolist() for column in ("NODENAME", "Object", "Counter")]
+        yield zip(
+            [dataset_id] * count, [technology] * count, [window] * count, *ids,
+            timestamps[col_idx].tolist(), values[row_idx, col_idx].tolist(),
+        )
+
+
+def save_dataset(dataset, path=None):
+    """
+    Load the numeric KPI frames of a parsed dataset (see lib.datastore.KPIDataset) into the store.
+    The dataset id is its content hash, so an upload already stored is skipped.
+    The rows and the datasets entry are written in one transaction, so queries never see a partial upload;
+    the indexes are created once the rows are in.
+    Returns the number of values stored.
+    """
+    with _write_lock:
+        connection = _connect(path)
+        try:
+            stored = connection.execute("SELECT rows FROM datasets WHERE dataset_id = ?", (dataset.id,)).fetchone()
+            if stored is not None:
+                return stored[0]
+            rows = 0
+            with connection:
+                for technology in KPI_TECHNOLOGIES:
+                    for window in KPI_WINDOWS:
+                        numeric = dataset.numeric_frame(frame_key(technology, window))
+                        for batch in _long_row_batches(dataset.id, technology, window, numeric):
+                            cursor = connection.executemany("INSERT INTO kpi VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+                            rows += max(cursor.rowcount, 0)
+                connection.execute(
+                    "INSERT INTO datasets VALUES (?, ?, ?, ?)",
+                    (dataset.id, dataset.name, time.time(), rows),
+                )
+                for statement in _INDEXES:
+                    connection.execute(statement)
+            return rows
+        finally:
+            connection.close()
+
+
+# Datasets in the store, newest first
+def list_stored_datasets(path=None):
+    connection = _connect(path)
+    try:
+        return pd.read_sql_query(
+            "SELECT dataset_id, name, created, rows FROM datasets ORDER BY created DESC", connection
+        )
+    finally:
+        connection.close()
+
+
+# SQL condition matching a column against any of several glob patterns (* and ? wildcards, case-sensitive)
+def _glob_condition(expression, patterns, params):
+    params.extend(patterns)
+    return "(" + " OR ".join(f"{expression} GLOB ?" for _ in patterns) + ")"
+
+
+def query_kpis(group_by=("Counter",), method="AVERAGE", dataset_ids=None, technologies=None, windows=None,
+               nodenames=None, counters=None, objects=None, start=None, end=None,
+               limit=MAX_QUERY_ROWS, path=None):
+    """
+    Filtered aggregation over the KPI values of any number of stored datasets, computed by SQLite.
+    group_by: columns of GROUP_COLUMNS, e.g. ("Counter", "Day")
+    method: 'AVERAGE', 'MAX', 'MIN', 'SUM'
+    nodenames/counters/objects: glob patterns as in process_kpi_logs, e.g. ["NODE01*"]
+    start/end: inclusive "YYYY-MM-DD HH:MM" bounds (a date prefix works too)
+    Returns one row per group with the aggregated value and the number of samples.
+    """
+    unknown = [column for column in group_by if column not in GROUP_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unsupported group_by columns: {', '.join(unknown)}")
+    if method not in SQL_AGG_FUNCS:
+        raise ValueError(f"Unsupported aggregation method: {method}")
+
+    conditions, params = [], []
+    for expression, values in (("kpi.dataset_id", dataset_ids), ("kpi.technology", technologies), ("kpi.window", windows)):
+        if values:
+            conditions.append(f"{expression} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+    for expression, patterns in (("kpi.nodename", nodenames), ("kpi.counter", counters), ("kpi.object", objects)):
+        if patterns:
+            conditions.append(_glob_condition(expression, list(patterns), params))
+    if start:
+        conditions.append("kpi.ts >= ?")
+        params.append(start)
+    if end:
+        # A bare date or hour as end bound includes the whole day or hour
+        conditions.append("kpi.ts <= ?")
+        params.append(end + "\uffff")
+
+    select = [f"{GROUP_COLUMNS[column]} AS \"{column}\"" for column in group_by]
+    select += [f"{SQL_AGG_FUNCS[method]}(kpi.value) AS value", "COUNT(kpi.value) AS samples"]
+    sql = f"SELECT {', '.join(select)} FROM kpi"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    if group_by:
+        sql += f" GROUP BY {', '.join(GROUP_COLUMNS[column] for column in group_by)}"
+        sql += f" ORDER BY {', '.join(GROUP_COLUMNS[column] for column in group_by)}"
+    sql += " LIMIT ?"
+    params.append(int(limit))
+
+    connection = _connect(path)
+    try:
+        result = pd.read_sql_query(sql, connection, params=params)
+        if "Dataset" in result.columns:
+            names = dict(connection.execute("SELECT dataset_id, name FROM datasets").fetchall())
+            result["Dataset"] = [f"{names.get(dataset_id, '?')} ({dataset_id[:8]})" for dataset_id in result["Dataset"]]
+    finally:
+        connection.close()
+    return result
@@ -1,849 +1,759 @@
 import streamlit as st
 import pandas as pd
-import os
-import zipfile
-import tempfile
-from lib.KPI import process_kpi_logs
 import datetime
+import os
+from lib.KPI import KPI_TECHNOLOGIES, KPI_WINDOWS, MAX_ROP, frame_key
+from lib.jobs import submit_upload_job, submit_report_job, get_job
+from lib.reports import REPORT_FORMATS
+from lib.ingest import INGEST_DIR, INGEST_POLL_SECONDS, start_ingest_watcher, ingest_now, list_ingested
+from lib.datastore import acquire_dataset, list_datasets
+from lib.store import GROUP_COLUMNS, SQL_AGG_FUNCS, MAX_QUERY_ROWS, store_enabled, list_stored_datasets, query_kpis
+from lib.compare import compare_windows, rank_degradation, change_matrix
+from lib.anomaly import scan_anomalies
+from lib.formulas import aggregate_derived, parse_formulas
+from lib.rollup import RESOLUTIONS, pick_resolution, resolution_columns
+from lib.overlay import ROP_AXIS, align_windows, select_offsets, overlay_plot_data
+from lib.figures import cached_figure, selection_hash
+from lib.engine import aggregate_data, split_by_counter, technology_summary, select_counter, top_bottom
+import numpy as np
 import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 
 # Initialize session state to store data across page loads
 if 'page' not in st.session_state:
     st.session_state.page = 'upload'
-if 'KPI_5G_BEFORE' not in st.session_state:
-    st.session_state.KPI_5G_BEFORE = pd.DataFrame()
-if 'KPI_5G_AFTER' not in st.session_state:
-    st.session_state.KPI_5G_AFTER = pd.DataFrame()
-if 'KPI_LTE_BEFORE' not in st.session_state:
-    st.session_state.KPI_LTE_BEFORE = pd.DataFrame()
-if 'KPI_LTE_AFTER' not in st.session_state:
-    st.session_state.KPI_LTE_AFTER = pd.DataFrame()
-if 'date_columns' not in st.session_state:
-    st.session_state.date_columns = []
-if 'date_columns_lte' not in st.session_state:
-    st.session_state.date_columns_lte = []
-if 'all_counters' not in st.session_state:
-    st.session_state.all_counters = []
-if 'all_counters_lte' not in st.session_state:
-    st.session_state.all_counters_lte = []
-if 'all_nodenames' not in st.session_state:
-    st.session_state.all_nodenames = []
-if 'all_nodenames_lte' not in st.session_state:
-    st.session_state.all_nodenames_lte = []
+# Handle on the shared dataset opened by this session; the KPI frames themselves live in lib.datastore
+if 'dataset' not in st.session_state:
+    st.session_state.dataset = None
 if 'aggregation_mode' not in st.session_state:
     st.session_state.aggregation_mode = 'ALL'
+if 'active_job_id' not in st.session_state:
+    st.session_state.active_job_id = None
+if 'job_error' not in st.session_state:
+    st.session_state.job_error = None
+if 'report_job_id' not in st.session_state:
+    st.session_state.report_job_id = None
+# Derived KPI definitions as entered and as parsed: tuple of (name, expression)
+if 'formulas_text' not in st.session_state:
+    st.session_state.formulas_text = ""
+if 'formulas' not in st.session_state:
+    st.session_state.formulas = ()
+
+# Seconds between reruns while a background job is being watched
+JOB_POLL_INTERVAL = 0.5
+# Seconds between refreshes of the watched directory status
+INGEST_REFRESH_INTERVAL = 5
+
+# Dumps dropped into the watched directory are parsed in the background, without any browser upload
+start_ingest_watcher()
+
+# Analysis pages offered for every technology: (page id prefix, navigation title)
+PAGE_TYPES = [
+    ("chart_analysis", "CHART ANALYSIS"),
+    ("top10_analysis", "TOP 10 HIGH/LOWEST KPI Specific Analysis"),
+    ("delta_analysis", "BEFORE VS AFTER DELTA"),
+    ("anomaly_scan", "ANOMALY SCAN"),
+    ("change_heatmap", "CHANGE HEATMAP"),
+]
+
+# Navigation title -> (page id, page type, technology), e.g. "[KPI 5G] CHART ANALYSIS" -> chart_analysis_5g
+PAGES = {
+    f"[KPI {technology}] {title}": (f"{page_type}_{technology.lower()}", page_type, technology)
+    for technology in KPI_TECHNOLOGIES
+    for page_type, title in PAGE_TYPES
+}
+# Pages working across every stored upload rather than the opened dataset
+PAGES["QUERY STORED UPLOADS"] = ("query_store", "query_store", None)
+
+# KPI frame of the dataset opened by this session, empty if none is open
+def get_frame(key):
+    if st.session_state.dataset is None:
+        return pd.DataFrame()
+    return st.session_state.dataset.dataset.frame(key)
+
+# Reference a shared dataset from this session; returns False if it is no longer available
+def open_dataset(dataset_id):
+    handle = acquire_dataset(dataset_id)
+    if handle is None:
+        return False
+    if st.session_state.dataset is not None:
+        st.session_state.dataset.release()
+    st.session_state.dataset = handle
+    return True
+
+# Numeric KPI rows of one technology and window, plus the derived KPIs of this session.
+# Computed once per dataset and formula set for all sessions.
+def get_numeric_frame(technology, window):
+    dataset = st.session_state.dataset.dataset
+    return dataset.numeric_frame(frame_key(technology, window), st.session_state.formulas)
+
+# KPI rows of one technology and window at a time resolution, split by counter
+# method is the aggregation over the ROPs of each HOURLY/DAILY bucket
+def get_counter_groups(technology, window, resolution="RAW", method="AVERAGE"):
+    key = frame_key(technology, window)
+    formulas = st.session_state.formulas
+    if resolution == "RAW":
+        method = None
+    dataset = st.session_state.dataset.dataset
+    return dataset.cached(
+        ("counter_groups", key, formulas, resolution, method),
+        lambda: split_by_counter(dataset.rollup(key, resolution, method, formulas)),
+    )
 
-# Helper function to aggregate data
-def aggregate_data(data, group_mode, method):
-    """
-    Aggregate data based on group mode and aggregation method
-    group_mode: 'ALL', 'NODENAME', 'OBJECT'
-    method: 'AVERAGE', 'MAX', 'MIN', 'SUM'
-    """
-    if data.empty:
-        return data
-    
-    # Create a copy to avoid modifying original data
-    df = data.copy()
-    
-    # Identify date columns (excluding NODENAME, Object, Counter)
-    date_columns = [col for col in df.columns if col not in ['NODENAME', 'Object', 'Counter']]
-    
-    # Perform aggregation based on group_mode
-    if group_mode == 'ALL':
-        # Aggregate all data together
-        agg_funcs = {
-            'AVERAGE': 'mean',
-            'MAX': 'max',
-            'MIN': 'min',
-            'SUM': 'sum'
-        }
-        
-        agg_func = agg_funcs.get(method, 'mean')
-        
-        # Apply aggregation to date columns only
-        result_data = {}
-        result_data['NODENAME'] = ['ALL']  # Single row for all aggregated data
-        result_data['Object'] = [df['Object'].iloc[0]]  # Use first object
-        result_data['Counter'] = [df['Counter'].iloc[0]]  # Use first counter
-        
-        for col in date_columns:
-            values = pd.to_numeric(df[col], errors='coerce')
-            if agg_func == 'mean':
-                result_data[col] = [values.mean()]
-            elif agg_func == 'max':
-                result_data[col] = [values.max()]
-            elif agg_func == 'min':
-                result_data[col] = [values.min()]
-            elif agg_func == 'sum':
-                result_data[col] = [values.sum()]
-        
-        return pd.DataFrame(result_data)
-    
-    elif group_mode == 'NODENAME':
-        # Group by NODENAME and aggregate
-        agg_funcs = {
-            'AVERAGE': 'mean',
-            'MAX': 'max', 
-            'MIN': 'min',
-            'SUM': 'sum'
-        }
-        
-        agg_func = agg_funcs.get(method, 'mean')
-        
-        # Convert date columns to numeric before aggregation
-        for col in date_columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        # Group by NODENAME, Object, and Counter, then aggregate date columns
-        group_cols = ['NODENAME', 'Object', 'Counter']
-        aggregated = df.groupby(group_cols)[date_columns].agg(agg_func).reset_index()
-        return aggregated
-    
-    elif group_mode == 'OBJECT':
-        # Group by Object and aggregate
-        agg_funcs = {
-            'AVERAGE': 'mean',
-            'MAX': 'max',
-            'MIN': 'min',
-            'SUM': 'sum'
-        }
-        
-        agg_func = agg_funcs.get(method, 'mean')
-        
-        # Convert date columns to numeric before aggregation
-        for col in date_columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        # Group by Object and Counter, then aggregate date columns - keeping NODENAME as well
-        group_cols = ['Object', 'Counter']
-        aggregated = df.groupby(group_cols)[date_columns].agg(agg_func).reset_index()
-        
-        # Add a placeholder for NODENAME since we're grouping by Object
-        aggregated['NODENAME'] = 'AGGREGATED_BY_OBJECT'
-        return aggregated
-    
-    else:
-        # Default to no aggregation
-        return data
-
-# Function to go to visualization page
-def go_to_visualization():
-    st.session_state.page = 'chart_analysis_5g'  # Default to 5G chart analysis page
+# Both windows of a technology aligned on a shared relative ROP axis, split by counter
+# Returns the axis (offset -> datetime of each window) and {window: counter groups}
+def get_aligned(technology, resolution="RAW", method="AVERAGE"):
+    formulas = st.session_state.formulas
+    if resolution == "RAW":
+        method = None
+    dataset = st.session_state.dataset.dataset
+
+    def align():
+        frames = {window: dataset.rollup(frame_key(technology, window), resolution, method, formulas) for window in KPI_WINDOWS}
+        axis, aligned = align_windows(frames)
+        return axis, {window: split_by_counter(frame) for window, frame in aligned.items()}
+
+    return dataset.cached(("aligned", technology, formulas, resolution, method), align)
+
+# BEFORE vs AFTER statistics of every (NODENAME, Object, Counter) of one technology
+def get_comparison(technology):
+    dataset = st.session_state.dataset.dataset
+    return dataset.cached(
+        ("comparison", technology, st.session_state.formulas),
+        lambda: compare_windows(get_numeric_frame(technology, "BEFORE"), get_numeric_frame(technology, "AFTER")),
+    )
 
-# Main application based on current page
-if st.session_state.page == 'upload':
-    # App title
-    st.title("KPI Comparison Tool - Upload Page")
+# Counter x NODENAME percentage change and severity matrices of one technology, computed once per dataset
+def get_change_matrix(technology, lower_is_better):
+    dataset = st.session_state.dataset.dataset
+    return dataset.cached(
+        ("change_matrix", technology, st.session_state.formulas, tuple(sorted(lower_is_better))),
+        lambda: change_matrix(dataset.numeric_frame(frame_key(technology, "BEFORE")),
+                              dataset.numeric_frame(frame_key(technology, "AFTER")),
+                              lower_is_better, dict(st.session_state.formulas)),
+    )
 
-    # Section for user inputs
-    st.header("Input Parameters")
+# Ranked anomalies of one technology, scanned once per dataset and threshold for all sessions
+def get_anomalies(technology, threshold):
+    dataset = st.session_state.dataset.dataset
+    return dataset.cached(
+        ("anomalies", technology, st.session_state.formulas, threshold),
+        lambda: scan_anomalies(get_numeric_frame(technology, "BEFORE"), get_numeric_frame(technology, "AFTER"), threshold),
+    )
 
-    # Note about folder structure
-    st.info("Note: Upload a ZIP file containing 'Before' and 'After' subdirectories with log files.")
+# Date columns, counters and nodenames of one technology, computed once per dataset for all sessions
+def get_summary(technology):
+    dataset = st.session_state.dataset.dataset
+    return dataset.cached(
+        ("summary", technology, st.session_state.formulas),
+        lambda: technology_summary(get_numeric_frame(technology, "BEFORE"), get_numeric_frame(technology, "AFTER")),
+    )
 
-    # Upload ZIP file containing Before and After directories
-    uploaded_zip = st.file_uploader("Upload ZIP file with 'Before' and 'After' directories:", type=["zip"])
+# Comma-separated filter input -> list of globs
+def split_filter(text):
+    return [item.strip() for item in text.split(",") if item.strip()]
 
-    if uploaded_zip is not None:
-        # Define BEFORE_TIME and AFTER_TIME
-        before_time = st.text_input("BEFORE_TIME (format: YYYY-MM-DD HH:MM or 'NO_START'):", value="NO_START")
-        after_time = st.text_input("AFTER_TIME (format: YYYY-MM-DD HH:MM or 'NO_START'):", value="NO_START")
+# Function to go to visualization page
+def go_to_visualization():
+    st.session_state.page = 'chart_analysis_5g'  # Default to 5G chart analysis page
 
-        # Button to trigger processing
-        if st.button("Process KPI Logs and Go to Visualization"):
-            with st.spinner("Processing KPI logs..."):
-                # Create temporary directory to extract the ZIP file
-                with tempfile.TemporaryDirectory() as temp_dir:
-                    # Extract the ZIP file to the temporary directory
-                    with zipfile.ZipFile(uploaded_zip, 'r') as zip_ref:
-                        zip_ref.extractall(temp_dir)
-                    
-                    # Define the Before and After paths
-                    folder_before = os.path.join(temp_dir, "Before")
-                    folder_after = os.path.join(temp_dir, "After")
-                    
-                    # Validate that both directories exist in the extracted ZIP
-                    before_exists = os.path.isdir(folder_before)
-                    after_exists = os.path.isdir(folder_after)
-                    
-                    if not before_exists:
-                        st.error(f"'Before' folder does not exist in the uploaded ZIP file: {folder_before}")
-                    elif not after_exists:
-                        st.error(f"'After' folder does not exist in the uploaded ZIP file: {folder_after}")
-                    else:
-                        # Process KPI logs with progress indication
-                        progress_bar = st.progress(0)
-                        
-                        # Process 5G BEFORE data
-                        progress_bar.progress(20, text="Processing 5G BEFORE data...")
-                        KPI_5G_BEFORE = process_kpi_logs(folder_before, "GREP_KPI_5G", before_time)
-                        
-                        # Process 5G AFTER data
-                        progress_bar.progress(40, text="Processing 5G AFTER data...")
-                        KPI_5G_AFTER = process_kpi_logs(folder_after, "GREP_KPI_5G", after_time)
-                        
-                        # Process LTE BEFORE data
-                        progress_bar.progress(60, text="Processing LTE BEFORE data...")
-                        KPI_LTE_BEFORE = process_kpi_logs(folder_before, "GREP_KPI_LTE", before_time)
-                        
-                        # Process LTE AFTER data
-                        progress_bar.progress(80, text="Processing LTE AFTER data...")
-                        KPI_LTE_AFTER = process_kpi_logs(folder_after, "GREP_KPI_LTE", after_time)
-                        
-                        # Store 5G data in session state
-                        st.session_state.KPI_5G_BEFORE = KPI_5G_BEFORE
-                        st.session_state.KPI_5G_AFTER = KPI_5G_AFTER
-                        
-                        # Store LTE data in session state
-                        st.session_state.KPI_LTE_BEFORE = KPI_LTE_BEFORE
-                        st.session_state.KPI_LTE_AFTER = KPI_LTE_AFTER
-                        
-                        # Get 5G date columns
-                        date_columns = [col for col in KPI_5G_BEFORE.columns if col not in ['NODENAME', 'Object', 'Counter']]
-                        st.session_state.date_columns = date_columns
-                        
-                        # Get 5G unique counters for charting
-                        if not KPI_5G_BEFORE.empty:
-                            unique_counters = KPI_5G_BEFORE['Counter'].unique()
-                        else:
-                            unique_counters = []
-                        
-                        if not KPI_5G_AFTER.empty:
-                            unique_counters_after = KPI_5G_AFTER['Counter'].unique()
-                            all_counters = list(set(list(unique_counters) + list(unique_counters_after)))
-                        else:
-                            all_counters = list(unique_counters)
-                        
-                        st.session_state.all_counters = all_counters
-                        
-                        # Get 5G unique nodenames for selection
-                        if not KPI_5G_BEFORE.empty:
-                            unique_nodenames_before = KPI_5G_BEFORE['NODENAME'].unique()
-                        else:
-                            unique_nodenames_before = []
-                        
-                        if not KPI_5G_AFTER.empty:
-                            unique_nodenames_after = KPI_5G_AFTER['NODENAME'].unique()
-                        else:
-                            unique_nodenames_after = []
-                        
-                        all_nodenames = list(set(list(unique_nodenames_before) + list(unique_nodenames_after)))
-                        st.session_state.all_nodenames = all_nodenames
-                        
-                        # Get LTE date columns
-                        date_columns_lte = [col for col in KPI_LTE_BEFORE.columns if col not in ['NODENAME', 'Object', 'Counter']]
-                        st.session_state.date_columns_lte = date_columns_lte
-                        
-                        # Get LTE unique counters for charting
-                        if not KPI_LTE_BEFORE.empty:
-                            unique_counters_lte = KPI_LTE_BEFORE['Counter'].unique()
-                        else:
-                            unique_counters_lte = []
-                        
-                        if not KPI_LTE_AFTER.empty:
-                            unique_counters_after_lte = KPI_LTE_AFTER['Counter'].unique()
-                            all_counters_lte = list(set(list(unique_counters_lte) + list(unique_counters_after_lte)))
-                        else:
-                            all_counters_lte = list(unique_counters_lte)
-                        
-                        st.session_state.all_counters_lte = all_counters_lte
-                        
-                        # Get LTE unique nodenames for selection
-                        if not KPI_LTE_BEFORE.empty:
-                            unique_nodenames_before_lte = KPI_LTE_BEFORE['NODENAME'].unique()
-                        else:
-                            unique_nodenames_before_lte = []
-                        
-                        if not KPI_LTE_AFTER.empty:
-                            unique_nodenames_after_lte = KPI_LTE_AFTER['NODENAME'].unique()
-                        else:
-                            unique_nodenames_after_lte = []
-                        
-                        all_nodenames_lte = list(set(list(unique_nodenames_before_lte) + list(unique_nodenames_after_lte)))
-                        st.session_state.all_nodenames_lte = all_nodenames_lte
-                        
-                        # Show the dataframes
-                        st.subheader("KPI 5G BEFORE Data")
-                        st.dataframe(KPI_5G_BEFORE)
-                        
-                        st.subheader("KPI 5G AFTER Data")
-                        st.dataframe(KPI_5G_AFTER)
-                        
-                        st.subheader("KPI LTE BEFORE Data")
-                        st.dataframe(KPI_LTE_BEFORE)
-                        
-                        st.subheader("KPI LTE AFTER Data")
-                        st.dataframe(KPI_LTE_AFTER)
-                        
-                        progress_bar.progress(100, text="Processing complete!")
-                        
-                        # Go to visualization page
-                        go_to_visualization()
-                        st.rerun()
+# Poll the background job of this session; only this fragment reruns until the job finishes
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_job_progress():
+    job = get_job(st.session_state.active_job_id)
+    if job is None:
+        st.session_state.active_job_id = None
+        st.rerun()
+    elif job.status == 'done':
+        st.session_state.active_job_id = None
+        if open_dataset(job.dataset_id):
+            # Go to visualization page
+            go_to_visualization()
+        else:
+            st.session_state.job_error = "The processed dataset is no longer available, please process it again."
+        st.rerun()
+    elif job.status == 'failed':
+        st.session_state.active_job_id = None
+        st.session_state.job_error = job.error
+        st.rerun()
+    else:
+        info = job.snapshot()
+        st.progress(info['progress'], text=info['message'])
+
+# Poll the per-node report job of this session; only this fragment reruns until the job finishes
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def show_report_progress():
+    job = get_job(st.session_state.report_job_id)
+    if job is None or job.finished:
+        # A full rerun shows the result outside this fragment, which stops the polling
+        st.rerun()
+    info = job.snapshot()
+    st.progress(info['progress'], text=info['message'])
+
+# State of the per-node report job of this session, with its ZIP offered once done
+def show_report_job():
+    job = get_job(st.session_state.report_job_id)
+    if job is None:
+        st.session_state.report_job_id = None
+        return
+    if not job.finished:
+        show_report_progress()
+        return
+    info = job.snapshot()
+    if info['status'] == 'failed':
+        st.error(info['error'])
+    elif job.output_path and os.path.exists(job.output_path):
+        output_path = job.output_path
+
+        # Read only when the button is clicked, not on every rerun
+        def read_report():
+            with open(output_path, "rb") as f:
+                return f.read()
+
+        st.write(info['message'])
+        st.download_button(
+            label="Download Node Reports",
+            data=read_report,
+            file_name=os.path.basename(output_path),
+            mime="application/zip"
+        )
 
-else:  # Visualization pages
-    # Create sidebar for navigation (only shown after upload)
-    st.sidebar.title("Navigation")
-    page_selection = st.sidebar.radio("Go to", [
-        "[KPI 5G] CHART ANALYSIS", 
-        "[KPI 5G] TOP 10 HIGH/LOWEST KPI Specific Analysis",
-        "[KPI LTE] CHART ANALYSIS", 
-        "[KPI LTE] TOP 10 HIGH/LOWEST KPI Specific Analysis"
-    ])
-    
-    if page_selection == "[KPI 5G] CHART ANALYSIS":
-        st.session_state.page = "chart_analysis_5g"
-    elif page_selection == "[KPI 5G] TOP 10 HIGH/LOWEST KPI Specific Analysis":
-        st.session_state.page = "top10_analysis_5g"
-    elif page_selection == "[KPI LTE] CHART ANALYSIS":
-        st.session_state.page = "chart_analysis_lte"
-    elif page_selection == "[KPI LTE] TOP 10 HIGH/LOWEST KPI Specific Analysis":
-        st.session_state.page = "top10_analysis_lte"
+# Dumps found in the watched directory; only this fragment reruns to refresh their state
+@st.fragment(run_every=INGEST_REFRESH_INTERVAL)
+def show_ingested_dumps():
+    ingested = list_ingested()
+    if not ingested:
+        st.write("No dumps found yet.")
+    for dump in ingested:
+        col1, col2 = st.columns([3, 1])
+        if dump['status'] in ('queued', 'running'):
+            col1.progress(dump['progress'], text=f"**{dump['name']}**: {dump['message']}")
+            continue
+        if dump['status'] == 'failed':
+            col1.write(f"**{dump['name']}**: failed ({dump['error']})")
+            continue
+        col1.write(f"**{dump['name']}**: {dump['message'] or 'processed'}")
+        if col2.button("Open", key=f"open_ingested_{dump['path']}"):
+            if open_dataset(dump['dataset_id']):
+                go_to_visualization()
+            else:
+                # Evicted from memory since it was parsed; parse it again and open it when done
+                job = ingest_now(dump['path'])
+                st.session_state.active_job_id = job.id if job is not None else None
+            st.rerun()
+
+# Common header of the analysis pages; stops the script if the technology has no data
+def page_header(title, technology):
+    st.title(f"KPI Comparison Tool - [KPI {technology}] {title}")
 
-# Handle the visualization pages
-if st.session_state.page == 'chart_analysis_5g':
-    st.title("KPI Comparison Tool - [KPI 5G] CHART ANALYSIS")
-    
     # Back button to upload page
     if st.button("Back to Upload Page"):
         st.session_state.page = 'upload'
         st.rerun()
-    
+
     # Check if data exists
-    if st.session_state.KPI_5G_BEFORE.empty or st.session_state.KPI_5G_AFTER.empty:
-        st.error("No data available. Please go back and upload a ZIP file first.")
+    if get_frame(frame_key(technology, "BEFORE")).empty or get_frame(frame_key(technology, "AFTER")).empty:
+        st.error(f"No {technology} data available. Please go back and upload a ZIP file first.")
         st.stop()
-    
-    # Custom chart visualization inputs
-    st.subheader("Custom Chart Configuration")
-    
-    # Date range selection using slider
-    if st.session_state.date_columns:
-        # Create a slider for date range selection
-        date_range_indices = st.slider(
-            "Select date range:", 
-            min_value=0, 
-            max_value=len(st.session_state.date_columns)-1, 
-            value=(0, len(st.session_state.date_columns)-1),
-            format="%s",
-            key="date_range_slider"
-        )
-        
-        start_idx, end_idx = date_range_indices
-        start_date = st.session_state.date_columns[start_idx]
-        end_date = st.session_state.date_columns[end_idx]
-    else:
+
+# ROP range selection on the axis shared by both windows (offset from each window's start)
+# Returns the selected rows of the RAW axis: offset -> datetime of each window
+def select_rop_range(technology, label, key):
+    axis, _ = get_aligned(technology)
+    if axis.empty:
         st.error("No date columns available for visualization.")
         st.stop()
-    
-    # Aggregation Mode control (global)
-    st.session_state.aggregation_mode = st.selectbox(
-        "Aggregation Mode (applies to all charts):",
-        options=["ALL", "NODENAME", "OBJECT"],
-        index=["ALL", "NODENAME", "OBJECT"].index(st.session_state.aggregation_mode),
-        key="agg_mode_select"
-    )
-    
-    # Add "All" option for NODENAME selection
-    all_nodenames_with_all = ["All"] + st.session_state.all_nodenames
-    selected_options = st.multiselect("Select NODENAMES to include in charts:", 
-                                      options=all_nodenames_with_all, 
-                                      default=["All"] if st.session_state.all_nodenames else [],
-                                      key="selected_nodenames")
-    
-    # Handle "All" selection
-    if "All" in selected_options:
-        selected_nodenames = st.session_state.all_nodenames
-    else:
-        selected_nodenames = selected_options
-
-    # Get data from session state
-    KPI_5G_BEFORE = st.session_state.KPI_5G_BEFORE
-    KPI_5G_AFTER = st.session_state.KPI_5G_AFTER
-
-    # Get the date columns for chart visualization
-    date_columns = st.session_state.date_columns[start_idx:end_idx+1]
-
-    # Generate charts for each counter with interactivity
-    st.info(f"Generating charts for {len(st.session_state.all_counters)} counters...")
-    progress_bar = st.progress(0)
-    total_counters = len(st.session_state.all_counters)
-    
-    for idx, counter in enumerate(st.session_state.all_counters):
-        # Update progress bar
-        progress_percentage = int((idx / total_counters) * 100)
-        progress_bar.progress(progress_percentage / 100, text=f"Processing counter {idx + 1} of {total_counters}: {counter}")
-        st.subheader(f"Charts for Counter: {counter}")
-        
-        # Per-chart aggregation method selector
-        agg_method = st.selectbox(
-            f"Aggregation Method for {counter}:",
-            options=["AVERAGE", "MAX", "MIN", "SUM"],
-            index=0,  # Default to AVERAGE
-            key=f"agg_method_{counter}"
-        )
 
-        # Filter data for the specific counter
-        if counter in KPI_5G_BEFORE['Counter'].values:
-            before_data = KPI_5G_BEFORE[KPI_5G_BEFORE['Counter'] == counter]
-            # Filter by selected nodenames
-            before_data = before_data[before_data['NODENAME'].isin(selected_nodenames)]
-            
-            # Apply aggregation based on user selection
-            before_data = aggregate_data(before_data, st.session_state.aggregation_mode, agg_method)
-
-            # Create line chart for BEFORE data
-            if not before_data.empty:
-                # Prepare data for plotting
-                before_plot_data = before_data[date_columns].T
-                before_plot_data.columns = before_data['NODENAME'].values
-                before_plot_data.index.name = 'Datetime'
-                before_plot_data = before_plot_data.reset_index()
-
-                # Convert all nodename columns to numeric, handling non-numeric values
-                for col in before_data['NODENAME'].values:
-                    if col in before_plot_data.columns:
-                        before_plot_data[col] = pd.to_numeric(before_plot_data[col], errors='coerce')
-
-                # Create line chart
-                chart_title = f"BEFORE - {counter} (Aggregation: {st.session_state.aggregation_mode} / {agg_method})"
-                fig_before = px.line(
-                    before_plot_data,
-                    x='Datetime',
-                    y=before_plot_data.columns.tolist()[1:],  # All columns except Datetime
-                    title=chart_title,
-                    labels={'value': 'Counter Value', 'variable': 'NODENAME'}
-                )
-                
-                # Show the chart
-                st.plotly_chart(fig_before, use_container_width=True, key=f"before_chart_{counter}")
-
-        if counter in KPI_5G_AFTER['Counter'].values:
-            after_data = KPI_5G_AFTER[KPI_5G_AFTER['Counter'] == counter]
-            # Filter by selected nodenames
-            after_data = after_data[after_data['NODENAME'].isin(selected_nodenames)]
-            
-            # Apply aggregation based on user selection
-            after_data = aggregate_data(after_data, st.session_state.aggregation_mode, agg_method)
-
-            # Create line chart for AFTER data
-            if not after_data.empty:
-                # Prepare data for plotting
-                after_plot_data = after_data[date_columns].T
-                after_plot_data.columns = after_data['NODENAME'].values
-                after_plot_data.index.name = 'Datetime'
-                after_plot_data = after_plot_data.reset_index()
-
-                # Convert all nodename columns to numeric, handling non-numeric values
-                for col in after_data['NODENAME'].values:
-                    if col in after_plot_data.columns:
-                        after_plot_data[col] = pd.to_numeric(after_plot_data[col], errors='coerce')
-
-                # Create line chart
-                chart_title = f"AFTER - {counter} (Aggregation: {st.session_state.aggregation_mode} / {agg_method})"
-                fig_after = px.line(
-                    after_plot_data,
-                    x='Datetime',
-                    y=after_plot_data.columns.tolist()[1:],  # All columns except Datetime
-                    title=chart_title,
-                    labels={'value': 'Counter Value', 'variable': 'NODENAME'}
-                )
-
-                # Show the chart
-                st.plotly_chart(fig_after, use_container_width=True, key=f"after_chart_{counter}")
-    
-    # Complete progress bar
-    progress_bar.progress(100, text="All charts generated successfully!")
+    start_idx, end_idx = st.slider(
+        label,
+        min_value=0,
+        max_value=len(axis)-1,
+        value=(0, len(axis)-1),
+        format="ROP +%d",
+        key=key
+    )
+    rop_range = axis.iloc[start_idx:end_idx+1]
+    spans = []
+    for window in KPI_WINDOWS:
+        columns = rop_range[window].dropna()
+        spans.append(f"{window}: {columns.iloc[0]} to {columns.iloc[-1]}" if not columns.empty else f"{window}: no ROPs")
+    st.caption(" | ".join(spans))
+    return rop_range
+
+# Time resolution selection; AUTO picks the finest one that keeps charts readable for the selected ROPs
+def select_resolution(rop_range, key):
+    choice = st.selectbox("Time resolution:", options=["AUTO"] + RESOLUTIONS, index=0, key=key)
+    if choice != "AUTO":
+        return choice
+    longest = max((rop_range[window].dropna().tolist() for window in KPI_WINDOWS), key=len)
+    resolution = pick_resolution(longest)
+    if resolution != "RAW":
+        st.caption(f"Showing {resolution} rollups for the selected range.")
+    return resolution
+
+# Aligned axis and counter groups at a resolution, restricted to the offsets covering the selected RAW ROP range
+def get_aligned_range(technology, rop_range, resolution, method):
+    axis, groups = get_aligned(technology, resolution, method)
+    selected = {window: resolution_columns(rop_range[window].dropna().tolist(), resolution) for window in KPI_WINDOWS}
+    return axis.loc[select_offsets(axis, selected)], groups
+
+# NODENAME multiselect with an "All" option; returns the selected nodenames
+def select_nodenames(summary, label, key):
+    all_nodenames_with_all = ["All"] + summary['nodenames']
+    selected_options = st.multiselect(label,
+                                      options=all_nodenames_with_all,
+                                      default=["All"] if summary['nodenames'] else [],
+                                      key=key)
 
-elif st.session_state.page == 'top10_analysis_5g':
-    st.title("KPI Comparison Tool - [KPI 5G] TOP 10 HIGH/LOWEST KPI Specific Analysis")
-    
-    # Back button to upload page
-    if st.button("Back to Upload Page"):
-        st.session_state.page = 'upload'
-        st.rerun()
-    
-    # Check if data exists
-    if st.session_state.KPI_5G_BEFORE.empty or st.session_state.KPI_5G_AFTER.empty:
-        st.error("No data available. Please go back and upload a ZIP file first.")
-        st.stop()
-    
-    # Add "All" option for NODENAME selection
-    all_nodenames_with_all = ["All"] + st.session_state.all_nodenames
-    selected_options = st.multiselect("Select NODENAMES to include in analysis:", 
-                                      options=all_nodenames_with_all, 
-                                      default=["All"] if st.session_state.all_nodenames else [],
-                                      key="top10_selected_nodenames")
-    
     # Handle "All" selection
     if "All" in selected_options:
-        selected_nodenames = st.session_state.all_nodenames
-    else:
-        selected_nodenames = selected_options
-
-    # Date range selection using slider for analysis page
-    if st.session_state.date_columns:
-        # Create a slider for date range selection
-        date_range_indices = st.slider(
-            "Select date range for analysis:", 
-            min_value=0, 
-            max_value=len(st.session_state.date_columns)-1, 
-            value=(0, len(st.session_state.date_columns)-1),
-            format="%s",
-            key="top10_date_range_slider"
+        return summary['nodenames']
+    return selected_options
+
+# BEFORE vs AFTER overlay line chart of one counter, None if the selection has no data
+# Both windows are drawn on the relative ROP axis, so they lie on top of each other
+# Built figures are cached across reruns and sessions until the data or a filter changes
+def overlay_figure(technology, counter, nodenames, aggregation_mode, method, rop_range, resolution):
+    def build():
+        axis, groups = get_aligned_range(technology, rop_range, resolution, method)
+        formulas = dict(st.session_state.formulas)
+        aggregated = {}
+        for window in KPI_WINDOWS:
+            # Roll up over time with the same method, then aggregate across nodes
+            if counter in formulas:
+                # Derived KPIs are computed from the aggregated counters they reference
+                aggregated[window] = aggregate_derived(groups[window], counter, formulas[counter], nodenames,
+                                                       aggregation_mode, method)
+                continue
+            data = select_counter(groups[window], counter, nodenames)
+            if data is not None and not data.empty:
+                aggregated[window] = aggregate_data(data, aggregation_mode, method)
+
+        plot_data = overlay_plot_data(aggregated, axis, axis.index.tolist())
+        if plot_data.empty:
+            return None
+        return px.line(
+            plot_data,
+            x=ROP_AXIS,
+            y='value',
+            color='NODENAME',
+            line_dash='Window',
+            hover_data=['Datetime'],
+            title=f"BEFORE vs AFTER - {counter} (Aggregation: {aggregation_mode} / {method}, {resolution})",
+            labels={'value': 'Counter Value', ROP_AXIS: f"{resolution} offset from window start"}
         )
-        
-        start_idx, end_idx = date_range_indices
-        start_date = st.session_state.date_columns[start_idx]
-        end_date = st.session_state.date_columns[end_idx]
-    else:
-        st.error("No date columns available for visualization.")
-        st.stop()
 
-    # Get data from session state
-    KPI_5G_BEFORE = st.session_state.KPI_5G_BEFORE
-    KPI_5G_AFTER = st.session_state.KPI_5G_AFTER
+    key = ("overlay", st.session_state.dataset.id, technology, st.session_state.formulas, counter,
+           aggregation_mode, method, resolution, selection_hash(nodenames), rop_range.index[0], rop_range.index[-1])
+    return cached_figure(key, build)
 
-    # Get the date columns for chart visualization
-    date_columns = st.session_state.date_columns[start_idx:end_idx+1]
+def render_chart_page(technology):
+    page_header("CHART ANALYSIS", technology)
+    summary = get_summary(technology)
+    suffix = technology.lower()
 
-    # Generate analysis for each counter
-    for counter in st.session_state.all_counters:
-        st.subheader(f"Analysis for Counter: {counter}")
-        
-        # Datetime selection for analysis
-        selected_datetime = st.selectbox(f"Select datetime to analyze for {counter}:", 
-                                         options=date_columns, 
-                                         key=f"top10_datetime_select_{counter}")
-        
-        # Show top/bottom performers for the selected datetime
-        if counter in KPI_5G_BEFORE['Counter'].values:
-            before_data = KPI_5G_BEFORE[KPI_5G_BEFORE['Counter'] == counter]
-            before_data = before_data[before_data['NODENAME'].isin(selected_nodenames)]
-            
-            if not before_data.empty and selected_datetime in before_data.columns:
-                # Get data for the selected datetime
-                datetime_data = before_data[['NODENAME', selected_datetime]].copy()
-                # Convert the selected datetime column to numeric, handling non-numeric values
-                datetime_data[selected_datetime] = pd.to_numeric(datetime_data[selected_datetime], errors='coerce')
-                datetime_data = datetime_data.dropna()  # Remove rows with non-numeric values
-                
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    # Show top 10 lowest performers (sorted ascending)
-                    top_lowest = datetime_data.nsmallest(10, selected_datetime)
-                    st.write(f"**Top 10 LOWEST performers at {selected_datetime} - BEFORE**")
-                    st.dataframe(top_lowest)
-                
-                with col2:
-                    # Show top 10 highest performers (sorted descending)
-                    top_highest = datetime_data.nlargest(10, selected_datetime)
-                    st.write(f"**Top 10 HIGHEST performers at {selected_datetime} - BEFORE**")
-                    st.dataframe(top_highest)
-        
-        if counter in KPI_5G_AFTER['Counter'].values:
-            after_data = KPI_5G_AFTER[KPI_5G_AFTER['Counter'] == counter]
-            after_data = after_data[after_data['NODENAME'].isin(selected_nodenames)]
-            
-            if not after_data.empty and selected_datetime in after_data.columns:
-                # Get data for the selected datetime
-                datetime_data = after_data[['NODENAME', selected_datetime]].copy()
-                # Convert the selected datetime column to numeric, handling non-numeric values
-                datetime_data[selected_datetime] = pd.to_numeric(datetime_data[selected_datetime], errors='coerce')
-                datetime_data = datetime_data.dropna()  # Remove rows with non-numeric values
-                
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    # Show top 10 lowest performers (sorted ascending)
-                    top_lowest = datetime_data.nsmallest(10, selected_datetime)
-                    st.write(f"**Top 10 LOWEST performers at {selected_datetime} - AFTER**")
-                    st.dataframe(top_lowest)
-                
-                with col2:
-                    # Show top 10 highest performers (sorted descending)
-                    top_highest = datetime_data.nlargest(10, selected_datetime)
-                    st.write(f"**Top 10 HIGHEST performers at {selected_datetime} - AFTER**")
-                    st.dataframe(top_highest)
-
-elif st.session_state.page == 'chart_analysis_lte':
-    st.title("KPI Comparison Tool - [KPI LTE] CHART ANALYSIS")
-    
-    # Back button to upload page
-    if st.button("Back to Upload Page"):
-        st.session_state.page = 'upload'
-        st.rerun()
-    
-    # Check if data exists
-    if st.session_state.KPI_LTE_BEFORE.empty or st.session_state.KPI_LTE_AFTER.empty:
-        st.error("No LTE data available. Please go back and upload a ZIP file first.")
-        st.stop()
-    
     # Custom chart visualization inputs
     st.subheader("Custom Chart Configuration")
-    
-    # Date range selection using slider
-    if st.session_state.date_columns_lte:
-        # Create a slider for date range selection
-        date_range_indices = st.slider(
-            "Select date range:", 
-            min_value=0, 
-            max_value=len(st.session_state.date_columns_lte)-1, 
-            value=(0, len(st.session_state.date_columns_lte)-1),
-            format="%s",
-            key="date_range_slider_lte"
-        )
-        
-        start_idx, end_idx = date_range_indices
-        start_date = st.session_state.date_columns_lte[start_idx]
-        end_date = st.session_state.date_columns_lte[end_idx]
-    else:
-        st.error("No date columns available for visualization.")
-        st.stop()
-    
+    rop_range = select_rop_range(technology, "Select ROP range (from the start of each window):", f"date_range_slider_{suffix}")
+    resolution = select_resolution(rop_range, f"resolution_select_{suffix}")
+
     # Aggregation Mode control (global)
     st.session_state.aggregation_mode = st.selectbox(
         "Aggregation Mode (applies to all charts):",
         options=["ALL", "NODENAME", "OBJECT"],
         index=["ALL", "NODENAME", "OBJECT"].index(st.session_state.aggregation_mode),
-        key="agg_mode_select_lte"
+        key=f"agg_mode_select_{suffix}"
     )
-    
-    # Add "All" option for NODENAME selection
-    all_nodenames_with_all = ["All"] + st.session_state.all_nodenames_lte
-    selected_options = st.multiselect("Select NODENAMES to include in charts:", 
-                                      options=all_nodenames_with_all, 
-                                      default=["All"] if st.session_state.all_nodenames_lte else [],
-                                      key="selected_nodenames_lte")
-    
-    # Handle "All" selection
-    if "All" in selected_options:
-        selected_nodenames = st.session_state.all_nodenames_lte
-    else:
-        selected_nodenames = selected_options
-
-    # Get data from session state
-    KPI_LTE_BEFORE = st.session_state.KPI_LTE_BEFORE
-    KPI_LTE_AFTER = st.session_state.KPI_LTE_AFTER
 
-    # Get the date columns for chart visualization
-    date_columns = st.session_state.date_columns_lte[start_idx:end_idx+1]
+    selected_nodenames = select_nodenames(summary, "Select NODENAMES to include in charts:", f"selected_nodenames_{suffix}")
 
     # Generate charts for each counter with interactivity
-    st.info(f"Generating charts for {len(st.session_state.all_counters_lte)} counters...")
+    counters = summary['counters']
+    st.info(f"Generating charts for {len(counters)} counters...")
     progress_bar = st.progress(0)
-    total_counters = len(st.session_state.all_counters_lte)
-    
-    for idx, counter in enumerate(st.session_state.all_counters_lte):
+    total_counters = len(counters)
+
+    for idx, counter in enumerate(counters):
         # Update progress bar
         progress_percentage = int((idx / total_counters) * 100)
         progress_bar.progress(progress_percentage / 100, text=f"Processing counter {idx + 1} of {total_counters}: {counter}")
         st.subheader(f"Charts for Counter: {counter}")
-        
+
         # Per-chart aggregation method selector
         agg_method = st.selectbox(
             f"Aggregation Method for {counter}:",
             options=["AVERAGE", "MAX", "MIN", "SUM"],
             index=0,  # Default to AVERAGE
-            key=f"agg_method_lte_{counter}"
+            key=f"agg_method_{suffix}_{counter}"
         )
 
-        # Filter data for the specific counter
-        if counter in KPI_LTE_BEFORE['Counter'].values:
-            before_data = KPI_LTE_BEFORE[KPI_LTE_BEFORE['Counter'] == counter]
-            # Filter by selected nodenames
-            before_data = before_data[before_data['NODENAME'].isin(selected_nodenames)]
-            
-            # Apply aggregation based on user selection
-            before_data = aggregate_data(before_data, st.session_state.aggregation_mode, agg_method)
-
-            # Create line chart for BEFORE data
-            if not before_data.empty:
-                # Prepare data for plotting
-                before_plot_data = before_data[date_columns].T
-                before_plot_data.columns = before_data['NODENAME'].values
-                before_plot_data.index.name = 'Datetime'
-                before_plot_data = before_plot_data.reset_index()
-
-                # Convert all nodename columns to numeric, handling non-numeric values
-                for col in before_data['NODENAME'].values:
-                    if col in before_plot_data.columns:
-                        before_plot_data[col] = pd.to_numeric(before_plot_data[col], errors='coerce')
-
-                # Create line chart
-                chart_title = f"BEFORE - {counter} (Aggregation: {st.session_state.aggregation_mode} / {agg_method})"
-                fig_before = px.line(
-                    before_plot_data,
-                    x='Datetime',
-                    y=before_plot_data.columns.tolist()[1:],  # All columns except Datetime
-                    title=chart_title,
-                    labels={'value': 'Counter Value', 'variable': 'NODENAME'}
-                )
-                
-                # Show the chart
-                st.plotly_chart(fig_before, use_container_width=True, key=f"before_chart_lte_{counter}")
-
-        if counter in KPI_LTE_AFTER['Counter'].values:
-            after_data = KPI_LTE_AFTER[KPI_LTE_AFTER['Counter'] == counter]
-            # Filter by selected nodenames
-            after_data = after_data[after_data['NODENAME'].isin(selected_nodenames)]
-            
-            # Apply aggregation based on user selection
-            after_data = aggregate_data(after_data, st.session_state.aggregation_mode, agg_method)
-
-            # Create line chart for AFTER data
-            if not after_data.empty:
-                # Prepare data for plotting
-                after_plot_data = after_data[date_columns].T
-                after_plot_data.columns = after_data['NODENAME'].values
-                after_plot_data.index.name = 'Datetime'
-                after_plot_data = after_plot_data.reset_index()
-
-                # Convert all nodename columns to numeric, handling non-numeric values
-                for col in after_data['NODENAME'].values:
-                    if col in after_plot_data.columns:
-                        after_plot_data[col] = pd.to_numeric(after_plot_data[col], errors='coerce')
-
-                # Create line chart
-                chart_title = f"AFTER - {counter} (Aggregation: {st.session_state.aggregation_mode} / {agg_method})"
-                fig_after = px.line(
-                    after_plot_data,
-                    x='Datetime',
-                    y=after_plot_data.columns.tolist()[1:],  # All columns except Datetime
-                    title=chart_title,
-                    labels={'value': 'Counter Value', 'variable': 'NODENAME'}
-                )
-
-                # Show the chart
-                st.plotly_chart(fig_after, use_container_width=True, key=f"after_chart_lte_{counter}")
-    
+        fig = overlay_figure(technology, counter, selected_nodenames, st.session_state.aggregation_mode,
+                             agg_method, rop_range, resolution)
+        if fig is not None:
+            # Show the chart
+            st.plotly_chart(fig, use_container_width=True, key=f"overlay_chart_{suffix}_{counter}")
+
     # Complete progress bar
     progress_bar.progress(100, text="All charts generated successfully!")
 
-elif st.session_state.page == 'top10_analysis_lte':
-    st.title("KPI Comparison Tool - [KPI LTE] TOP 10 HIGH/LOWEST KPI Specific Analysis")
-    
-    # Back button to upload page
+def render_top10_page(technology):
+    page_header("TOP 10 HIGH/LOWEST KPI Specific Analysis", technology)
+    summary = get_summary(technology)
+    suffix = technology.lower()
+
+    selected_nodenames = select_nodenames(summary, "Select NODENAMES to include in analysis:", f"top10_selected_nodenames_{suffix}")
+    rop_range = select_rop_range(technology, "Select ROP range for analysis (from the start of each window):", f"top10_date_range_slider_{suffix}")
+    resolution = select_resolution(rop_range, f"top10_resolution_select_{suffix}")
+    rollup_method = "AVERAGE"
+    if resolution != "RAW":
+        rollup_method = st.selectbox(f"Aggregation over each {resolution} bucket:",
+                                     options=["AVERAGE", "MAX", "MIN", "SUM"],
+                                     index=0,
+                                     key=f"top10_rollup_method_{suffix}")
+    axis, _ = get_aligned_range(technology, rop_range, resolution, rollup_method)
+
+    def rop_label(offset):
+        datetimes = ", ".join(f"{window}: {axis.at[offset, window] if pd.notna(axis.at[offset, window]) else '-'}" for window in KPI_WINDOWS)
+        return f"+{offset} ({datetimes})"
+
+    # Generate analysis for each counter
+    for counter in summary['counters']:
+        st.subheader(f"Analysis for Counter: {counter}")
+
+        # ROP selection for analysis; each window is analyzed at its own datetime for that offset
+        selected_offset = st.selectbox(f"Select ROP to analyze for {counter}:",
+                                       options=axis.index.tolist(),
+                                       format_func=rop_label,
+                                       key=f"top10_datetime_select_{suffix}_{counter}")
+
+        # Show top/bottom performers for the selected datetime
+        for window in KPI_WINDOWS:
+            selected_datetime = axis.at[selected_offset, window] if selected_offset is not None else None
+            data = select_counter(get_counter_groups(technology, window, resolution, rollup_method), counter, selected_nodenames)
+            if data is None or data.empty or selected_datetime not in data.columns:
+                continue
+
+            top_lowest, top_highest = top_bottom(data, selected_datetime)
+            col1, col2 = st.columns(2)
+
+            with col1:
+                # Show top 10 lowest performers (sorted ascending)
+                st.write(f"**Top 10 LOWEST performers at {selected_datetime} - {window}**")
+                st.dataframe(top_lowest)
+
+            with col2:
+                # Show top 10 highest performers (sorted descending)
+                st.write(f"**Top 10 HIGHEST performers at {selected_datetime} - {window}**")
+                st.dataframe(top_highest)
+
+def render_delta_page(technology):
+    page_header("BEFORE VS AFTER DELTA", technology)
+    summary = get_summary(technology)
+    suffix = technology.lower()
+
+    selected_nodenames = select_nodenames(summary, "Select NODENAMES to include in analysis:", f"delta_selected_nodenames_{suffix}")
+    lower_is_better = st.multiselect("Counters where a lower value is better (e.g. drops, failures):",
+                                     options=summary['counters'],
+                                     key=f"delta_lower_is_better_{suffix}")
+    col1, col2, col3 = st.columns(3)
+    alpha = col1.selectbox("Significance level:", options=[0.01, 0.05, 0.1], index=1, key=f"delta_alpha_{suffix}")
+    only_significant = col2.checkbox("Only significant changes", value=False, key=f"delta_only_significant_{suffix}")
+    max_rows = col3.number_input("Rows to show:", min_value=10, value=100, step=10, key=f"delta_max_rows_{suffix}")
+
+    # Statistics are computed once per dataset; ranking only re-orients and sorts them
+    comparison = get_comparison(technology)
+    comparison = comparison[comparison['NODENAME'].isin(selected_nodenames)]
+    ranked = rank_degradation(comparison, lower_is_better, alpha)
+    if only_significant:
+        ranked = ranked[ranked['significant']]
+
+    st.info(
+        f"{int(ranked['significant'].sum())} of {len(ranked)} NODENAME/Object/Counter combinations changed "
+        f"significantly (Welch t-test, alpha={alpha}). Worst degradations first."
+    )
+    st.dataframe(ranked.head(int(max_rows)), use_container_width=True)
+
+def render_anomaly_page(technology):
+    page_header("ANOMALY SCAN", technology)
+    summary = get_summary(technology)
+    suffix = technology.lower()
+
+    st.info(
+        "Values are flagged when their robust z-score (median/MAD) is above the threshold, either against all "
+        "nodes for the same counter and ROP (peer_z) or against the node's own BEFORE values (baseline_z)."
+    )
+    col1, col2, col3 = st.columns(3)
+    threshold = col1.selectbox("Robust z-score threshold:", options=[3.0, 3.5, 5.0, 10.0], index=1, key=f"anomaly_threshold_{suffix}")
+    windows = col2.multiselect("Windows:", options=KPI_WINDOWS, default=KPI_WINDOWS, key=f"anomaly_windows_{suffix}")
+    max_rows = col3.number_input("Rows to show:", min_value=10, value=100, step=10, key=f"anomaly_max_rows_{suffix}")
+    selected_nodenames = select_nodenames(summary, "Select NODENAMES to include in analysis:", f"anomaly_selected_nodenames_{suffix}")
+    selected_counters = st.multiselect("Counters (empty for all):", options=summary['counters'], key=f"anomaly_counters_{suffix}")
+
+    # The scan runs once per dataset and threshold; filters only select rows of its result
+    with st.spinner("Scanning all nodes, counters and ROPs..."):
+        anomalies = get_anomalies(technology, threshold)
+    anomalies = anomalies[anomalies['NODENAME'].isin(selected_nodenames) & anomalies['Window'].isin(windows)]
+    if selected_counters:
+        anomalies = anomalies[anomalies['Counter'].isin(selected_counters)]
+
+    if anomalies.empty:
+        st.success("No anomalies found for the current selection.")
+        return
+
+    st.write(f"**{len(anomalies)} anomalous values on {anomalies['NODENAME'].nunique()} nodes**")
+    per_counter = anomalies.groupby(['Counter', 'Window']).size().unstack(fill_value=0)
+    st.write("**Anomalies per counter**")
+    st.dataframe(per_counter.sort_values(list(per_counter.columns), ascending=False), use_container_width=True)
+    st.write("**Most anomalous values**")
+    st.dataframe(anomalies.head(int(max_rows)), use_container_width=True)
+
+def render_query_page():
+    st.title("KPI Comparison Tool - Query Stored Uploads")
+
     if st.button("Back to Upload Page"):
         st.session_state.page = 'upload'
         st.rerun()
-    
-    # Check if data exists
-    if st.session_state.KPI_LTE_BEFORE.empty or st.session_state.KPI_LTE_AFTER.empty:
-        st.error("No LTE data available. Please go back and upload a ZIP file first.")
-        st.stop()
-    
-    # Add "All" option for NODENAME selection
-    all_nodenames_with_all = ["All"] + st.session_state.all_nodenames_lte
-    selected_options = st.multiselect("Select NODENAMES to include in analysis:", 
-                                      options=all_nodenames_with_all, 
-                                      default=["All"] if st.session_state.all_nodenames_lte else [],
-                                      key="top10_selected_nodenames_lte")
-    
-    # Handle "All" selection
-    if "All" in selected_options:
-        selected_nodenames = st.session_state.all_nodenames_lte
-    else:
-        selected_nodenames = selected_options
-
-    # Date range selection using slider for analysis page
-    if st.session_state.date_columns_lte:
-        # Create a slider for date range selection
-        date_range_indices = st.slider(
-            "Select date range for analysis:", 
-            min_value=0, 
-            max_value=len(st.session_state.date_columns_lte)-1, 
-            value=(0, len(st.session_state.date_columns_lte)-1),
-            format="%s",
-            key="top10_date_range_slider_lte"
+
+    if not store_enabled():
+        st.info("The query store is disabled (the default). Set the KPI_STORE_PATH environment variable to a SQLite file path to load processed uploads into it.")
+        return
+    stored = list_stored_datasets()
+    if stored.empty:
+        st.info("No uploads stored yet. Processed uploads are loaded into the query store in the background once processing completes.")
+        return
+
+    # Filters are pushed down to SQLite; only the aggregated rows are loaded
+    labels = {
+        row.dataset_id: f"{row.name} ({datetime.datetime.fromtimestamp(row.created).strftime('%Y-%m-%d %H:%M')}, {row.rows} values)"
+        for row in stored.itertuples()
+    }
+    dataset_ids = st.multiselect("Uploads:", options=list(labels), default=list(labels),
+                                 format_func=labels.get, key="query_datasets")
+    col1, col2 = st.columns(2)
+    technologies = col1.multiselect("Technologies (empty for all):", options=list(KPI_TECHNOLOGIES), key="query_technologies")
+    windows = col2.multiselect("Windows (empty for all):", options=KPI_WINDOWS, key="query_windows")
+
+    st.write("Filters (optional, comma-separated, * and ? wildcards allowed)")
+    col1, col2, col3 = st.columns(3)
+    nodenames = split_filter(col1.text_input("NODENAMES:", placeholder="e.g. NODE01*", key="query_nodenames"))
+    counters = split_filter(col2.text_input("Counters:", placeholder="e.g. pmRrcConnEstab*", key="query_counters"))
+    objects = split_filter(col3.text_input("Objects:", placeholder="e.g. NRCellDU=*", key="query_objects"))
+    col1, col2 = st.columns(2)
+    start = col1.text_input("From (YYYY-MM-DD HH:MM, optional):", key="query_start").strip()
+    end = col2.text_input("To (YYYY-MM-DD HH:MM, optional):", key="query_end").strip()
+
+    col1, col2, col3 = st.columns(3)
+    group_by = col1.multiselect("Group by:", options=list(GROUP_COLUMNS), default=["Counter", "Day"], key="query_group_by")
+    method = col2.selectbox("Aggregation method:", options=list(SQL_AGG_FUNCS), index=0, key="query_method")
+    limit = col3.number_input("Maximum rows:", min_value=10, max_value=MAX_QUERY_ROWS, value=1000, step=100, key="query_limit")
+
+    if not dataset_ids:
+        st.warning("Select at least one upload.")
+        return
+    with st.spinner("Querying the store..."):
+        result = query_kpis(group_by, method, dataset_ids, technologies, windows, nodenames, counters, objects,
+                            start or None, end or None, int(limit))
+
+    if result.empty:
+        st.info("No values match the current filters.")
+        return
+    st.write(f"**{len(result)} rows**" + (" (row limit reached)" if len(result) >= int(limit) else ""))
+
+    # One time column in the grouping is plotted as a line per remaining group
+    time_columns = [col for col in group_by if col in ("Datetime", "Hour", "Day")]
+    if len(time_columns) == 1:
+        series_columns = [col for col in group_by if col not in time_columns]
+        plot_data = result.copy()
+        plot_data["Series"] = plot_data[series_columns].astype(str).agg(" / ".join, axis=1) if series_columns else method
+        fig = px.line(plot_data, x=time_columns[0], y="value", color="Series",
+                      title=f"{method} by {', '.join(group_by)}")
+        st.plotly_chart(fig, use_container_width=True)
+    st.dataframe(result, use_container_width=True)
+
+def render_heatmap_page(technology):
+    page_header("CHANGE HEATMAP", technology)
+    summary = get_summary(technology)
+    suffix = technology.lower()
+
+    lower_is_better = st.multiselect("Counters where a lower value is better (e.g. drops, failures):",
+                                     options=summary['counters'],
+                                     key=f"heatmap_lower_is_better_{suffix}")
+    col1, col2 = st.columns(2)
+    max_counters = col1.number_input("Counters to show:", min_value=1, value=50, step=10, key=f"heatmap_max_counters_{suffix}")
+    max_nodes = col2.number_input("Nodes to show:", min_value=1, value=50, step=10, key=f"heatmap_max_nodes_{suffix}")
+
+    # One matrix for the whole dataset; rows and columns are already sorted worst first
+    pct_change, severity = get_change_matrix(technology, lower_is_better)
+    pct_change = pct_change.iloc[:int(max_counters), :int(max_nodes)]
+    severity = severity.iloc[:int(max_counters), :int(max_nodes)]
+    if severity.empty:
+        st.info("No counter has data in both windows.")
+        return
+
+    st.info("Change of the mean from BEFORE to AFTER per counter and node, all objects and ROPs pooled. "
+            "Red is a degradation. Worst counters and nodes first. Click a cell to see its chart.")
+
+    def build():
+        fig = px.imshow(
+            severity,
+            color_continuous_scale="RdYlGn_r",
+            color_continuous_midpoint=0,
+            aspect="auto",
+            labels={'x': 'NODENAME', 'y': 'Counter', 'color': 'Degradation %'},
+            title=f"BEFORE -> AFTER change - {technology}"
         )
-        
-        start_idx, end_idx = date_range_indices
-        start_date = st.session_state.date_columns_lte[start_idx]
-        end_date = st.session_state.date_columns_lte[end_idx]
+        fig.update_traces(hoverinfo="skip", hovertemplate=None)
+        # Invisible markers on the cell centers make the cells selectable with a click
+        counters = np.repeat(severity.index.to_numpy(), severity.shape[1])
+        nodenames = np.tile(severity.columns.to_numpy(), severity.shape[0])
+        fig.add_scatter(
+            x=nodenames,
+            y=counters,
+            mode="markers",
+            marker={'opacity': 0, 'size': 12, 'symbol': 'square'},
+            customdata=pct_change.to_numpy().ravel(),
+            hovertemplate="Counter: %{y}<br>NODENAME: %{x}<br>Change: %{customdata:.1f}%<extra></extra>",
+            showlegend=False
+        )
+        fig.update_layout(height=max(400, 20 * len(severity) + 150))
+        return fig
+
+    fig = cached_figure(("heatmap", st.session_state.dataset.id, technology, st.session_state.formulas,
+                         tuple(sorted(lower_is_better)), int(max_counters), int(max_nodes)), build)
+    event = st.plotly_chart(fig, use_container_width=True, on_select="rerun", selection_mode="points",
+                            key=f"heatmap_chart_{suffix}")
+
+    # Drill down into the selected cell
+    points = event.selection.points if event else []
+    if not points:
+        return
+    counter, nodename = points[0]['y'], points[0]['x']
+    st.subheader(f"{counter} on {nodename}")
+    axis, _ = get_aligned(technology)
+    detail = overlay_figure(technology, counter, [nodename], "ALL", "AVERAGE", axis,
+                            pick_resolution(max((axis[window].dropna().tolist() for window in KPI_WINDOWS), key=len)))
+    if detail is None:
+        st.info("No data for this cell.")
     else:
-        st.error("No date columns available for visualization.")
-        st.stop()
+        st.plotly_chart(detail, use_container_width=True, key=f"heatmap_detail_{suffix}")
 
-    # Get data from session state
-    KPI_LTE_BEFORE = st.session_state.KPI_LTE_BEFORE
-    KPI_LTE_AFTER = st.session_state.KPI_LTE_AFTER
+# Main application based on current page
+if st.session_state.page == 'upload':
+    # App title
+    st.title("KPI Comparison Tool - Upload Page")
 
-    # Get the date columns for chart visualization
-    date_columns = st.session_state.date_columns_lte[start_idx:end_idx+1]
+    # Section for user inputs
+    st.header("Input Parameters")
 
-    # Generate analysis for each counter
-    for counter in st.session_state.all_counters_lte:
-        st.subheader(f"Analysis for Counter: {counter}")
-        
-        # Datetime selection for analysis
-        selected_datetime = st.selectbox(f"Select datetime to analyze for {counter}:", 
-                                         options=date_columns, 
-                                         key=f"top10_datetime_select_lte_{counter}")
-        
-        # Show top/bottom performers for the selected datetime
-        if counter in KPI_LTE_BEFORE['Counter'].values:
-            before_data = KPI_LTE_BEFORE[KPI_LTE_BEFORE['Counter'] == counter]
-            before_data = before_data[before_data['NODENAME'].isin(selected_nodenames)]
-            
-            if not before_data.empty and selected_datetime in before_data.columns:
-                # Get data for the selected datetime
-                datetime_data = before_data[['NODENAME', selected_datetime]].copy()
-                # Convert the selected datetime column to numeric, handling non-numeric values
-                datetime_data[selected_datetime] = pd.to_numeric(datetime_data[selected_datetime], errors='coerce')
-                datetime_data = datetime_data.dropna()  # Remove rows with non-numeric values
-                
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    # Show top 10 lowest performers (sorted ascending)
-                    top_lowest = datetime_data.nsmallest(10, selected_datetime)
-                    st.write(f"**Top 10 LOWEST performers at {selected_datetime} - BEFORE**")
-                    st.dataframe(top_lowest)
-                
-                with col2:
-                    # Show top 10 highest performers (sorted descending)
-                    top_highest = datetime_data.nlargest(10, selected_datetime)
-                    st.write(f"**Top 10 HIGHEST performers at {selected_datetime} - BEFORE**")
-                    st.dataframe(top_highest)
-        
-        if counter in KPI_LTE_AFTER['Counter'].values:
-            after_data = KPI_LTE_AFTER[KPI_LTE_AFTER['Counter'] == counter]
-            after_data = after_data[after_data['NODENAME'].isin(selected_nodenames)]
-            
-            if not after_data.empty and selected_datetime in after_data.columns:
-                # Get data for the selected datetime
-                datetime_data = after_data[['NODENAME', selected_datetime]].copy()
-                # Convert the selected datetime column to numeric, handling non-numeric values
-                datetime_data[selected_datetime] = pd.to_numeric(datetime_data[selected_datetime], errors='coerce')
-                datetime_data = datetime_data.dropna()  # Remove rows with non-numeric values
-                
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    # Show top 10 lowest performers (sorted ascending)
-                    top_lowest = datetime_data.nsmallest(10, selected_datetime)
-                    st.write(f"**Top 10 LOWEST performers at {selected_datetime} - AFTER**")
-                    st.dataframe(top_lowest)
-                
-                with col2:
-                    # Show top 10 highest performers (sorted descending)
-                    top_highest = datetime_data.nlargest(10, selected_datetime)
-                    st.write(f"**Top 10 HIGHEST performers at {selected_datetime} - AFTER**")
-                    st.dataframe(top_highest)
+    # Note about folder structure
+    st.info("Note: Upload a ZIP file containing 'Before' and 'After' subdirectories with log files (.log, .log.gz or .log.zst).")
+
+    # Upload ZIP file containing Before and After directories
+    uploaded_zip = st.file_uploader("Upload ZIP file with 'Before' and 'After' directories:", type=["zip"])
+
+    if uploaded_zip is not None:
+        # Define BEFORE_TIME and AFTER_TIME
+        before_time = st.text_input("BEFORE_TIME (format: YYYY-MM-DD HH:MM or 'NO_START'):", value="NO_START")
+        after_time = st.text_input("AFTER_TIME (format: YYYY-MM-DD HH:MM or 'NO_START'):", value="NO_START")
+        max_rop = st.number_input("Maximum ROPs per window (0 = no limit):", min_value=0, value=MAX_ROP, step=1)
+
+        # Optional filters applied while parsing, so unrelated nodes and counters are never read
+        with st.expander("Filters (optional, comma-separated, * and ? wildcards allowed)"):
+            filters = {
+                'nodenames': split_filter(st.text_input("NODENAMES:", placeholder="e.g. NODE01*, SITE_A?")),
+                'counters': split_filter(st.text_input("Counters:", placeholder="e.g. pmRrcConnEstab*")),
+                'objects': split_filter(st.text_input("Objects:", placeholder="e.g. NRCellDU=*")),
+            }
+
+        # Button to trigger processing
+        if st.button("Process KPI Logs and Go to Visualization"):
+            # Parse in the background so the script thread stays free and a disconnect does not lose the work
+            job = submit_upload_job(uploaded_zip, before_time, after_time, filters, int(max_rop))
+            st.session_state.active_job_id = job.id
+            st.session_state.job_error = None
+            st.rerun()
+
+    if st.session_state.job_error:
+        st.error(st.session_state.job_error)
+
+    # Progress of the job started from this session
+    if st.session_state.active_job_id:
+        show_job_progress()
+
+    if store_enabled() and st.button("Query Stored Uploads"):
+        st.session_state.page = 'query_store'
+        st.session_state.navigation = "QUERY STORED UPLOADS"
+        st.rerun()
+
+    # Large dumps can be copied to the server instead of uploaded through the browser
+    if INGEST_DIR:
+        st.header("Watched Directory")
+        st.caption(f"Folders with 'Before' and 'After' subdirectories or ZIPs of them placed in {INGEST_DIR} "
+                   f"are processed automatically (checked every {INGEST_POLL_SECONDS:g} s). "
+                   "Parse options can be given in a '<name>.json' file next to a dump.")
+        show_ingested_dumps()
+
+    # Datasets processed by any session are shared; open one without parsing it again
+    datasets = list_datasets()
+    if datasets:
+        st.header("Processed Datasets")
+        for dataset in datasets:
+            created = datetime.datetime.fromtimestamp(dataset.created).strftime('%Y-%m-%d %H:%M:%S')
+            col1, col2 = st.columns([3, 1])
+            col1.write(f"**{dataset.name}** (processed {created}, {dataset.refcount} open sessions)")
+            if col2.button("Open", key=f"open_dataset_{dataset.id}"):
+                if open_dataset(dataset.id):
+                    go_to_visualization()
+                    st.rerun()
+                else:
+                    st.error("This dataset is no longer available, please process it again.")
+
+else:  # Visualization pages
+    # Create sidebar for navigation (only shown after upload)
+    st.sidebar.title("Navigation")
+    page_selection = st.sidebar.radio("Go to", list(PAGES), key="navigation")
+    st.session_state.page = PAGES[page_selection][0]
+
+    # Derived KPIs are evaluated from the raw counters and shown on every page like a counter
+    with st.sidebar.expander("Derived KPIs"):
+        if 'formulas_input' not in st.session_state:
+            st.session_state.formulas_input = st.session_state.formulas_text
+        st.session_state.formulas_text = st.text_area(
+            "One per line: NAME = expression over counters (+ - * / ** and parentheses)",
+            placeholder="RRC_SR = 100 * pmRrcConnEstabSucc / pmRrcConnEstabAtt",
+            key="formulas_input"
+        )
+        st.caption("Rollups and aggregations apply to the referenced counters before the expression, "
+                   "e.g. a SUM of 100 * succ / att is 100 * sum(succ) / sum(att).")
+        try:
+            counters = st.session_state.dataset.dataset.counters() if st.session_state.dataset is not None else None
+            st.session_state.formulas = tuple(parse_formulas(st.session_state.formulas_text, counters).items())
+        except ValueError as exc:
+            st.error(str(exc))
+
+# Handle the visualization pages
+for page_id, page_type, technology in PAGES.values():
+    if st.session_state.page == page_id:
+        if page_type == "chart_analysis":
+            render_chart_page(technology)
+        elif page_type == "top10_analysis":
+            render_top10_page(technology)
+        elif page_type == "delta_analysis":
+            render_delta_page(technology)
+        elif page_type == "anomaly_scan":
+            render_anomaly_page(technology)
+        elif page_type == "change_heatmap":
+            render_heatmap_page(technology)
+        elif page_type == "query_store":
+            render_query_page()
 
 
 # Export to Excel (available on both pages)
 output_file = "KPI_Report.xlsx"
 with pd.ExcelWriter(output_file, engine="openpyxl") as writer:
-    st.session_state.KPI_5G_BEFORE.to_excel(writer, sheet_name="KPI_5G_BEFORE", index=False)
-    st.session_state.KPI_5G_AFTER.to_excel(writer, sheet_name="KPI_5G_AFTER", index=False)
-    st.session_state.KPI_LTE_BEFORE.to_excel(writer, sheet_name="KPI_LTE_BEFORE", index=False)
-    st.session_state.KPI_LTE_AFTER.to_excel(writer, sheet_name="KPI_LTE_AFTER", index=False)
+    for technology in KPI_TECHNOLOGIES:
+        for window in KPI_WINDOWS:
+            key = frame_key(technology, window)
+            get_frame(key).to_excel(writer, sheet_name=key, index=False)
 
 # Provide download link in sidebar
 with st.sidebar:
@@ -855,4 +765,13 @@ with st.sidebar:
             data=f.read(),
             file_name=output_file,
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
\ No newline at end of file
+        )
+
+    # One bundle per NODENAME, built in worker processes and streamed into one ZIP
+    if st.session_state.dataset is not None:
+        with st.expander("Per-node Reports"):
+            report_formats = st.multiselect("Formats:", options=REPORT_FORMATS, default=REPORT_FORMATS, key="report_formats")
+            if st.button("Generate Node Reports", disabled=not report_formats):
+                st.session_state.report_job_id = submit_report_job(st.session_state.dataset.id, report_formats).id
+            if st.session_state.report_job_id:
+                show_report_job()